@@ -0,0 +1,141 @@
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from controller import max_jerk, max_kappa_rate
+from referenceline import reference_line
+from replay_data import sim_column_log, sim_data_player, get_columns
+from sweep import roads, get_road, save_table
+
+recording_patterns = ("*.simcol", "*.simlog", "*.pkl")
+
+
+def find_recordings(paths) -> list:
+    """
+    recordings in the given files, directories and glob patterns
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in recording_patterns:
+                files.extend(glob.glob(os.path.join(path, pattern)))
+        else:
+            files.extend(glob.glob(path))
+    return sorted(set(files))
+
+
+def load_columns(file_name: str) -> dict:
+    data = sim_data_player().load_file(file_name)
+    return data.columns if isinstance(data, sim_column_log) else get_columns(data)
+
+
+def get_lateral_error(ref_line: reference_line, x: np.ndarray, y: np.ndarray):
+    """
+    signed distance of every position to the nearest reference sample,
+    along the sample's normal
+    """
+    points = ref_line.get_point_arrays()
+    i = ref_line.get_projector().global_index_array(x, y)
+    angle = points.angle[i]
+    return -(x - points.x[i]) * np.sin(angle) + (y - points.y[i]) * np.cos(angle)
+
+
+kpi_names = (
+    "lat_error_rms",
+    "lat_error_max",
+    "jerk_max",
+    "jerk_violation_ratio",
+    "kappa_rate_saturation_ratio",
+    "acceleration_min",
+    "acceleration_max",
+    "acceleration_cmd_min",
+    "acceleration_cmd_max",
+)
+
+
+def get_run_kpis(file_name: str, road="straight_road") -> dict:
+    """
+    KPIs of one recording, all vectorized over the steps,
+    a recording without frames gives steps 0 and NaN KPIs
+    """
+    columns = load_columns(file_name)
+    t = np.asarray(columns["times"], dtype=float)
+    x = np.asarray(columns["vehicle_state_debug.x"], dtype=float)
+    y = np.asarray(columns["vehicle_state_debug.y"], dtype=float)
+    acceleration = np.asarray(columns["vehicle_state_debug.acceleration"], dtype=float)
+    acceleration_cmd = np.asarray(columns["controller_debug.acceleration"], dtype=float)
+    kappa_rate = np.asarray(columns["controller_debug.kappa_rate"], dtype=float)
+    if t.size == 0:
+        return dict(
+            {"file": file_name, "steps": 0, "duration": 0.0},
+            **dict.fromkeys(kpi_names, np.nan),
+        )
+    lat_error = get_lateral_error(get_road(road), x, y)
+    jerk = np.diff(acceleration) / np.diff(t) if t.size > 1 else np.zeros(1)
+    return {
+        "file": file_name,
+        "steps": t.size,
+        "duration": float(t[-1] - t[0]) if t.size else 0.0,
+        "lat_error_rms": float(np.sqrt(np.mean(lat_error**2))),
+        "lat_error_max": float(np.max(np.abs(lat_error))),
+        "jerk_max": float(np.max(np.abs(jerk))),
+        "jerk_violation_ratio": float(np.mean(np.abs(jerk) > max_jerk)),
+        # float32 recording of a command on the bound
+        "kappa_rate_saturation_ratio": float(
+            np.mean(np.abs(kappa_rate) >= max_kappa_rate * (1.0 - 1e-4))
+        ),
+        "acceleration_min": float(np.min(acceleration)),
+        "acceleration_max": float(np.max(acceleration)),
+        "acceleration_cmd_min": float(np.min(acceleration_cmd)),
+        "acceleration_cmd_max": float(np.max(acceleration_cmd)),
+    }
+
+
+def try_run_kpis(file_name: str, road="straight_road"):
+    """
+    output: (KPIs, None), or (None, error message) if the recording can not be analyzed
+    """
+    try:
+        return get_run_kpis(file_name, road), None
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
+
+
+def analyze_runs(files: list, road="straight_road", processes: int = None) -> list:
+    """
+    KPIs of every recording, one process per file at a time.
+    A failing recording is reported on stderr and left out of the rows.
+    """
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        results = [try_run_kpis(file_name, road) for file_name in files]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(try_run_kpis, files, [road] * len(files)))
+    rows = []
+    for file_name, (row, error) in zip(files, results):
+        if error is None:
+            rows.append(row)
+        else:
+            print(f"skipped {file_name}: {error}", file=sys.stderr)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="headless KPIs of sim recordings")
+    parser.add_argument("paths", nargs="+", help="recording files, directories or globs")
+    parser.add_argument("--road", default="straight_road", choices=list(roads))
+    parser.add_argument("--out", default="summary.csv", help="summary table (csv)")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    files = find_recordings(args.paths)
+    if not files:
+        raise SystemExit("no recordings found")
+    rows = analyze_runs(files, args.road, args.processes)
+    if not rows:
+        raise SystemExit("no recording could be analyzed")
+    save_table(rows, args.out)
+    print(f"{len(rows)} recordings -> {args.out}")
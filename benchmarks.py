@@ -0,0 +1,439 @@
+# Headless benchmarks of the simulation hot paths.
+#
+#   python benchmarks.py                      run all, compare with the baseline
+#   python benchmarks.py -k mpc -k sensor     only names containing mpc or sensor
+#   python benchmarks.py --out results.json   also write the results
+#   python benchmarks.py --save-baseline      store the results as new baseline
+#
+# Every workload is built from fixed seeds, so two runs time the same work.
+# A benchmark is flagged as regression when its best time per call is more
+# than --tolerance above the baseline. The best of several rounds is the least
+# disturbed by other load on the machine, and times are compared relative to
+# the calibration workload, which cancels a machine that is uniformly slower
+# right now (--absolute to turn this off). Baselines are only comparable on the
+# machine they were recorded on, the machine info is stored with them.
+#
+# import.controller times a fresh interpreter importing the simulation core.
+# It fails if plotting or dialog modules are loaded on that path, and the run
+# fails if it takes longer than cold_start_target, whatever the baseline says.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("MPLBACKEND", "Agg")  # no plot windows
+
+import numpy as np
+from controller import LatKmMpc_Controller, LongPid_Controller, ts, horizon
+from object import object, detect_sensor
+from referenceline import reference_line, straight_road
+from replay_data import (
+    get_columns,
+    sim_column_log,
+    sim_data_player,
+    sim_data_recorder,
+    sim_stream_recorder,
+    write_columns,
+)
+from simulation import make_default_simulation
+from vehicle_model import vehicle_model, VehicleFleet
+
+baseline_file = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmarks_baseline.json"
+)
+
+# seconds for python -c "import controller": 1.4 s while it loaded
+# matplotlib, 0.42 s without, numpy + scipy.sparse + osqp alone take 0.36 s.
+# The target leaves room for a noisy machine, not for matplotlib.
+cold_start_target = 0.8
+# must stay out of headless workers
+interactive_modules = ("matplotlib", "tkinter", "PIL")
+
+# name -> setup() returning (workload(), calls per workload())
+benchmarks = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+
+    return register
+
+
+def get_closed_loop_inputs(n_steps: int = 100):
+    """
+    (status, trajectory) of every step of a closed loop run, same every call
+    """
+    sim = make_default_simulation()
+    inputs = []
+
+    def collect(sim):
+        inputs.append((sim.ego.get_vehicle_status(), sim.control_ref))
+
+    sim.add_observer(collect)
+    sim.run(n_steps)
+    return inputs
+
+
+############ machine speed ############
+@benchmark("calibration")
+def bench_calibration():
+    """
+    fixed python and numpy work, measures how fast the machine is right now
+    """
+    rng = np.random.default_rng(0)
+    a = rng.standard_normal((64, 64))
+
+    def workload():
+        total = 0.0
+        for i in range(2000):
+            total += i * 0.5
+        for _ in range(20):
+            a @ a
+
+    return workload, 1
+
+
+############ reference line ############
+@benchmark("referenceline.construct")
+def bench_construct():
+    def workload():
+        reference_line.points_cache.clear()  # sampling, not the cache
+        reference_line(-5.0, 0.005, 0.0005)
+
+    return workload, 1
+
+
+@benchmark("referenceline.construct.cached")
+def bench_construct_cached():
+    reference_line(-5.0, 0.005, 0.0005)
+    return lambda: reference_line(-5.0, 0.005, 0.0005), 1
+
+
+@benchmark("referenceline.get_ref_points")
+def bench_get_ref_points():
+    def workload():
+        reference_line.points_cache.clear()
+        straight_road.get_ref_points(200.0)
+
+    return workload, 1
+
+
+@benchmark("referenceline.get_nearest_point")
+def bench_get_nearest_point():
+    ref_line = reference_line(-5.0, 0.005, 0.0005)
+    rng = np.random.default_rng(0)
+    # a vehicle moving along the line, the tracked case of the simulation
+    x = np.cumsum(rng.uniform(2.0, 4.0, 100))
+    y = -5.0 + 0.005 * x + 0.0005 * x**2 + rng.uniform(-2.0, 2.0, 100)
+    positions = list(zip(x.tolist(), y.tolist()))
+
+    def workload():
+        ref_line.get_projector().last_index.pop("bench", None)
+        for px, py in positions:
+            ref_line.get_nearest_point(px, py, key="bench")
+
+    return workload, len(positions)
+
+
+@benchmark("referenceline.get_points_from_S")
+def bench_get_points_from_S():
+    ref_line = reference_line(-5.0, 0.005, 0.0005)
+    nearest_point = ref_line.get_nearest_point(20.0, -4.0)
+    ds = 15.0 * ts * np.arange(horizon)
+    return lambda: ref_line.get_points_from_S(nearest_point, ds), 1
+
+
+@benchmark("referenceline.get_point_from_S")
+def bench_get_point_from_S():
+    ref_line = reference_line(-5.0, 0.005, 0.0005)
+    nearest_point = ref_line.get_nearest_point(20.0, -4.0)
+    return lambda: ref_line.get_point_from_S(nearest_point, 3.0), 1
+
+
+############ controllers ############
+def bench_lat_mpc(**options):
+    inputs = get_closed_loop_inputs()
+    mpc = LatKmMpc_Controller(ts, horizon, **options)
+
+    def workload():
+        mpc.prob = None  # every pass starts from a fresh workspace
+        for status, trajectory in inputs:
+            mpc.Update(status, trajectory)
+
+    return workload, len(inputs)
+
+
+benchmark("LatKmMpc_Controller.Update")(bench_lat_mpc)
+benchmark("LatKmMpc_Controller.Update.persistent")(
+    lambda: bench_lat_mpc(persistent=True)
+)
+benchmark("LatKmMpc_Controller.Update.condensed")(
+    lambda: bench_lat_mpc(formulation="condensed")
+)
+
+
+@benchmark("LongPid_Controller.Update")
+def bench_lon_pid():
+    ego = vehicle_model("ego", 0.0, 0.0, 15.0, 0.0, 0.0, 0.0)
+    target = object("car", 1.9, 5.0, 30.0, 20.0, straight_road)
+    pid = LongPid_Controller(1.5, 30.0)
+    return lambda: pid.Update(ego, target), 1
+
+
+############ vehicle model ############
+@benchmark("vehicle_model.kinematic_Update")
+def bench_kinematic_update():
+    ego = vehicle_model("ego", 0.01, 0.002, 15.0, 0.0, 0.0, 0.0)
+    return lambda: ego.kinematic_Update(kappa_rate=0.0, acceleration=0.0, dt=ts), 1
+
+
+@benchmark("vehicle_model.position")
+def bench_position():
+    ego = vehicle_model("ego", 0.01, 0.002, 15.0, 0.0, 0.0, 0.0)
+    return ego.position, 1
+
+
+@benchmark("VehicleFleet.kinematic_Update.10000")
+def bench_fleet_update():
+    rng = np.random.default_rng(0)
+    n = 10000
+    fleet = VehicleFleet(
+        [f"v{i}" for i in range(n)],
+        rng.uniform(-0.1, 0.1, n),
+        rng.uniform(-0.01, 0.01, n),
+        rng.uniform(5.0, 30.0, n),
+        0.0,
+        rng.uniform(0.0, 200.0, n),
+        rng.uniform(0.0, 100.0, n),
+    )
+    kappa_rate = rng.uniform(-0.05, 0.05, n)
+    return lambda: fleet.kinematic_Update(kappa_rate, 0.0, ts), 1
+
+
+############ sensor ############
+def bench_sensor(n_objects: int):
+    ego = vehicle_model("ego", 0.0, 0.0, 15.0, 0.0, 0.0, 40.0)
+    sensor = detect_sensor(ego)
+    for i in range(n_objects):
+        sensor.register_object(
+            object(f"car_{i}", 1.9, 5.0, 10.0 + 0.2 * i, 20.0, straight_road)
+        )
+    sensor.register_ref_line(straight_road)
+    start = [target.s for target in sensor.Object_list]
+    n_steps = 20
+
+    def workload():
+        # same 20 steps every time, objects would otherwise leave the road
+        for target, s in zip(sensor.Object_list, start):
+            target.set_s(s)
+        for _ in range(n_steps):
+            sensor.Update(ts)
+
+    return workload, n_steps
+
+
+for n_objects in (1, 100, 1000):
+    benchmark(f"detect_sensor.Update.{n_objects}")(
+        lambda n_objects=n_objects: bench_sensor(n_objects)
+    )
+
+
+############ recordings ############
+def get_recorded_run(n_steps: int = 1000):
+    sim = make_default_simulation()
+    return sim.run(n_steps)
+
+
+@benchmark("recorder.simlog.save_load.1000")
+def bench_simlog():
+    data = get_recorded_run()
+    file_name = os.path.join(tempfile.mkdtemp(), "bench.simlog")
+
+    def workload():
+        sim_stream_recorder().open(file_name).save_data(data)
+        sim_data_player().load_file(file_name)
+
+    return workload, 1
+
+
+@benchmark("recorder.pkl.save_load.1000")
+def bench_pkl():
+    data = get_recorded_run()
+    file_name = os.path.join(tempfile.mkdtemp(), "bench.pkl")
+    recorder = sim_data_recorder()
+    recorder.get_file_name = lambda: file_name  # no time stamp, same file every call
+
+    def workload():
+        recorder.save_data(data)
+        sim_data_player().load_file(file_name)
+
+    return workload, 1
+
+
+@benchmark("recorder.simcol.write_read.1000")
+def bench_simcol():
+    columns = get_columns(get_recorded_run())
+    file_name = os.path.join(tempfile.mkdtemp(), "bench.simcol")
+
+    def workload():
+        write_columns(file_name, columns)
+        sim_column_log(file_name).read(10.0, 20.0)
+
+    return workload, 1
+
+
+############ closed loop ############
+@benchmark("Simulation.step")
+def bench_simulation():
+    # whole episodes from the same start, an endless run would drive off the road
+    n_steps = 100
+    return lambda: make_default_simulation().run(n_steps), n_steps
+
+
+############ cold start ############
+@benchmark("import.controller")
+def bench_import_controller():
+    check = (
+        "import sys, controller\n"
+        "loaded = {name.split('.')[0] for name in sys.modules}\n"
+        f"sys.exit(' '.join(sorted(loaded & set({interactive_modules!r}))) or None)\n"
+    )
+    command = [sys.executable, "-c", check]
+    folder = os.path.dirname(os.path.abspath(__file__))
+
+    def workload():
+        result = subprocess.run(command, cwd=folder, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"import controller loads {result.stderr.strip()}")
+
+    return workload, 1
+
+
+def run_benchmarks(names: list, min_time: float = 0.2, repeat: int = 7) -> dict:
+    """
+    seconds per call of every benchmark: median and min over repeat rounds
+    of at least min_time. Rounds of different benchmarks are interleaved, so
+    a slow phase of the machine hits all of them instead of a few.
+    """
+    workloads = {}
+    for name in names:
+        workload, calls = benchmarks[name]()
+        workload()  # warm up, lazy setup and caches
+        # number of workload calls per round, so that one round takes min_time
+        t0 = time.perf_counter()
+        workload()
+        number = max(1, int(min_time / max(time.perf_counter() - t0, 1e-9)))
+        workloads[name] = (workload, calls, number)
+    rounds = {name: [] for name in names}
+    for _ in range(repeat):
+        for name, (workload, calls, number) in workloads.items():
+            t0 = time.perf_counter()
+            for _ in range(number):
+                workload()
+            rounds[name].append((time.perf_counter() - t0) / (number * calls))
+    return {
+        name: dict(
+            median=float(np.median(rounds[name])),
+            min=float(np.min(rounds[name])),
+            max=float(np.max(rounds[name])),
+            calls=workloads[name][1] * workloads[name][2] * repeat,
+        )
+        for name in names
+    }
+
+
+def get_machine_info() -> dict:
+    return dict(
+        platform=platform.platform(),
+        processor=platform.processor(),
+        cpu_count=os.cpu_count(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+    )
+
+
+def get_changes(results: dict, baseline: dict, absolute: bool = False) -> dict:
+    """
+    relative change of the best round against the baseline, per name
+    """
+    speed = 1.0
+    if not absolute and "calibration" in results and "calibration" in baseline:
+        speed = results["calibration"]["min"] / baseline["calibration"]["min"]
+    return {
+        name: result["min"] / (baseline[name]["min"] * speed) - 1
+        for name, result in results.items()
+        if name in baseline and name != "calibration"
+    }
+
+
+def print_results(results: dict, changes: dict, baseline: dict, tolerance: float):
+    width = max(len(name) for name in results)
+    print(
+        f"{'benchmark':<{width}} {'median [us]':>12} {'best [us]':>10}"
+        f" {'baseline [us]':>14} {'change':>8}"
+    )
+    for name, result in results.items():
+        line = f"{name:<{width}} {result['median'] * 1e6:>12.1f} {result['min'] * 1e6:>10.1f}"
+        if name in baseline:
+            line += f" {baseline[name]['min'] * 1e6:>14.1f}"
+        if name in changes:
+            flag = "  REGRESSION" if changes[name] > tolerance else ""
+            line += f" {changes[name]:>+8.0%}{flag}"
+        print(line)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="headless hot path benchmarks")
+    parser.add_argument("-k", action="append", default=[], help="name filter")
+    parser.add_argument("--out", help="write the results as json")
+    parser.add_argument("--baseline", default=baseline_file)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--absolute", action="store_true", help="no calibration")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+    if args.save_baseline and args.k:
+        # every baseline entry must come from the same run as its calibration
+        parser.error("--save-baseline records all benchmarks, drop -k")
+
+    names = [
+        name
+        for name in benchmarks
+        if name == "calibration" or not args.k or any(k in name for k in args.k)
+    ]
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    results = run_benchmarks(names, args.min_time, args.repeat)
+    changes = get_changes(results, baseline, args.absolute)
+    print_results(results, changes, baseline, args.tolerance)
+
+    report = {"machine": get_machine_info(), "results": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"baseline : {args.baseline}")
+        return 0
+    regressions = [name for name, change in changes.items() if change > args.tolerance]
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.tolerance:.0%}: {', '.join(regressions)}")
+    cold_start = results.get("import.controller", {}).get("min")
+    if cold_start is not None and cold_start > cold_start_target:
+        print(f"import controller takes {cold_start:.2f} s, target {cold_start_target:.2f} s")
+        regressions.append("import.controller")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,14 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from vehicle_model import vehicle_status, vehicle_model
-from referenceline import reference_line
+from referenceline import reference_line, PointBatch
 from math import *
+import time
 import osqp
 import scipy.sparse as sp
+from mpc_solver import banded_ipm_solver
 from object import object
 from proto import sim_debug_pb2
+from instrumentation import span
 
 ts = 0.2  # sample time
 horizon = 10  # horizon length
@@ -20,10 +22,88 @@ state_min = np.array([-np.inf, -np.inf, -np.inf, -np.inf])
 state_max = np.array([np.inf, np.inf, np.inf, np.inf])
 
 
+class condensed_prediction:
+    """
+    prediction matrices of the kinematic model with the states eliminated,
+
+        X = Phi @ state0 + Gamma @ U + Psi @ W_0
+
+    Ad = I + N_d where N_d only holds the v0 / theta0 terms and N_d^3 = 0,
+    so Ad^k = I + k N_d + k (k - 1) / 2 N_d^2. The integer coefficients and
+    the block-Toeplitz layout of Gamma are built once; update() only has to
+    evaluate them for a new v0 / theta0.
+    """
+
+    def __init__(self, ts: float, horizon: int, nx: int = 4, nu: int = 1):
+        self.ts = ts
+        self.horizon = horizon
+        self.nx = nx
+        self.nu = nu
+        k = np.arange(horizon + 1, dtype=float)
+        self.k1 = k[:, None, None]
+        self.k2 = (k * (k - 1) / 2)[:, None, None]
+        # Gamma block (i, j) = Ad^(i - 1 - j) Bd for j < i
+        rows, cols, power = [], [], []
+        for i in range(1, horizon + 1):
+            for j in range(i):
+                rows.append(i)
+                cols.append(j)
+                power.append(i - 1 - j)
+        self.G_rows = np.array(rows)
+        self.G_cols = np.array(cols)
+        self.G_power = np.array(power)
+        self.Phi = np.zeros((horizon + 1, nx, nx))
+        self.Gamma = np.zeros((horizon + 1, nx, horizon))
+        self.Psi = np.zeros((horizon + 1, nx, nx))
+
+    def update(self, v0: float, theta0: float):
+        """
+        refresh Phi, Gamma, Psi for the given velocity and heading
+            output:
+                Phi [(N+1)*nx, nx], Gamma [(N+1)*nx, N], Psi [(N+1)*nx, nx]
+        """
+        ts = self.ts
+        N_d = np.zeros((self.nx, self.nx))
+        N_d[0, 2] = -v0 * sin(theta0) * ts
+        N_d[1, 2] = v0 * cos(theta0) * ts
+        N_d[2, 3] = v0 * ts
+        N_d2 = N_d @ N_d
+        self.Phi[:] = np.eye(self.nx) + self.k1 * N_d + self.k2 * N_d2
+        # x_0 = state0 + W_0, x_k+1 = Ad x_k + Bd u_k + W_0
+        self.Psi[:] = np.cumsum(self.Phi, axis=0)
+        AdB = self.Phi[: self.horizon, :, self.nx - 1] * ts  # Ad^m Bd
+        self.Gamma[self.G_rows, :, self.G_cols] = AdB[self.G_power]
+        n = (self.horizon + 1) * self.nx
+        return (
+            self.Phi.reshape(n, self.nx),
+            self.Gamma.reshape(n, self.horizon),
+            self.Psi.reshape(n, self.nx),
+        )
+
+
 class LatKmMpc_Controller:
-    def __init__(self, ts: float, horizon: int):
+    # Ad entries that depend on v0 / theta0, (row, col)
+    Ad_dynamic_entries = ((0, 2), (1, 2), (2, 3))
+
+    def __init__(
+        self,
+        ts: float,
+        horizon: int,
+        persistent: bool = False,
+        formulation: str = "sparse",
+        solver: str = "osqp",
+        gain_table=None,
+    ):
+        if formulation not in ("sparse", "condensed"):
+            raise ValueError(f"unknown MPC formulation: {formulation}")
+        if solver not in ("osqp", "banded"):
+            raise ValueError(f"unknown MPC solver: {solver}")
+        if solver == "banded" and formulation != "sparse":
+            raise ValueError("the banded solver needs the sparse formulation")
         self.ts = ts
         self.horizon = horizon
+        self.formulation = formulation
+        self.solver = solver
         # weight matrix
         self.Q = sp.csc_array(
             [
@@ -39,36 +119,60 @@ class LatKmMpc_Controller:
         self.ref = []
         # initial status
         self.init_status = vehicle_status(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        ## persistent OSQP workspace ##
+        self.persistent = persistent  # set up once, then only update data
+        self.prob = None
+        self.prob_key = None
+        self.weights_key = None  # (inputs, key) of the last get_weights_key
+        self.Ax_idx = None
+        self.Ax_order = None
+        self.l_buffer = None
+        self.u_buffer = None
+        self.last_solution = None
+        ## condensed formulation ##
+        self.prediction = None
+        self.Q_bar = None
+        self.Px_rows = None
+        self.Px_cols = None
+        ## banded interior point solver ##
+        self.banded = None
+        ## explicit MPC gain table, QP only when the bounds are hit ##
+        self.gain_table = None
+        self.gain_table_stats = {"hit": 0, "bound": 0, "out_of_grid": 0}
+        if gain_table is not None:
+            self.set_gain_table(gain_table)
         ## controller command ##
         self.lateral_cmd = 0.0
         self.longitudinal_cmd = 0.0
-    def Update(self, init_status: vehicle_status, trajectory) -> float:
-        """
-        Calculate the control command using Kinematic model and OSQP.
-
-        more details:
 
-            https://github.com/osqp/osqp
-
-        input:
-            init_status: initial status
-            trajectory: reference trajectory
-
-        output:
-            control command[ kappa rate]
+    def get_initial_state(self, init_status: vehicle_status):
+        """
+        initial state and the constant drift term of the kinematic model
+            output:
+                state0, W_0
         """
-        self.init_status = init_status
-        self.ref = trajectory  # update reference
-        x0 = init_status.x
-        y0 = init_status.y
         theta0 = init_status.theta
-        d_theta0 = init_status.theta - self.ref[0].angle
-        kappa0 = init_status.kappa
         v0 = init_status.velocity
-
-        state0 = np.array([x0, y0, d_theta0, kappa0])  # initial state
+        d_theta0 = init_status.theta - self.ref[0].angle
+        state0 = np.array(
+            [init_status.x, init_status.y, d_theta0, init_status.kappa]
+        )  # initial state
         W_0 = np.array([v0 * np.cos(theta0), v0 * np.sin(theta0), 0.0, 0.0])
-        Ad = sp.csc_matrix(
+        return state0, W_0
+
+    def get_dense_model(self, init_status: vehicle_status):
+        """
+        linearize the kinematic model around the initial status
+            input:
+                init_status: initial status
+            output:
+                state0, W_0, Ad, Bd (dense)
+        """
+        ts = self.ts
+        theta0 = init_status.theta
+        v0 = init_status.velocity
+        state0, W_0 = self.get_initial_state(init_status)
+        Ad = np.array(
             [
                 [1.0, 0.0, -v0 * sin(theta0) * ts, 0.0],
                 [0.0, 1.0, v0 * cos(theta0) * ts, 0.0],
@@ -76,49 +180,73 @@ class LatKmMpc_Controller:
                 [0.0, 0.0, 0.0, 1.0],
             ]
         )
-        Bd = sp.csc_matrix([[0.0], [0.0], [0.0], [1.0*ts]])
-        Wd = sp.csc_matrix(
-            [v0 * np.cos(theta0) * ts, v0 * np.sin(theta0) * ts, 0.0, 0.0]
-        )
-        [nx, nu] = Bd.shape
-        u_lower = -max_kappa_rate
-        u_upper = max_kappa_rate
-        # construct the cost
-        P = sp.block_diag(
+        Bd = np.array([[0.0], [0.0], [0.0], [1.0 * ts]])
+        return state0, W_0, Ad, Bd
+
+    def get_model(self, init_status: vehicle_status):
+        """
+        same as get_dense_model, with Ad and Bd as sparse matrices
+        """
+        state0, W_0, Ad, Bd = self.get_dense_model(init_status)
+        return state0, W_0, sp.csc_matrix(Ad), sp.csc_matrix(Bd)
+
+    def get_reference_states(self, trajectory):
+        """
+        reference state of every stage, x_r(0) ... x_r(N-1), x_r(N)
+            output:
+                state_r [horizon + 1, nx]
+        """
+        horizon = self.horizon
+        angle0 = trajectory[0].angle
+        ref_n = self.ref[-1]
+        if isinstance(trajectory, PointBatch):
+            state_r = np.vstack(
+                [
+                    np.column_stack(
+                        [trajectory.x, trajectory.y, trajectory.angle, trajectory.kappa]
+                    )[:horizon],
+                    [ref_n.x, ref_n.y, ref_n.angle, ref_n.kappa],
+                ]
+            )
+            state_r[:, 2] -= angle0
+            return state_r
+        return np.array(
             [
-                sp.kron(sp.eye(horizon), self.Q),
-                self.QN,
-                sp.kron(sp.eye(horizon), self.R),
-            ],
-            format="csc",
+                [pt.x, pt.y, pt.angle - angle0, pt.kappa]
+                for pt in list(trajectory[:horizon]) + [ref_n]  # 0 -> N
+            ]
         )
-        q = []
-        for i in range(horizon):  # 0 -> N-1
-            xr = trajectory[i].x
-            yr = trajectory[i].y
-            dl_theta = trajectory[i].angle - trajectory[0].angle
-            kappa_r = trajectory[i].kappa
-            state_r = np.array([xr, yr, dl_theta, kappa_r])
-            q = np.hstack([q, -self.Q @ state_r])
-        # print("part 1 q size:", q.shape)
-        state_rn = np.array(
+
+    def get_cost_vector(self, trajectory, nu: int = 1):
+        """
+        linear part of the cost, [-Q x_r(0) ... -QN x_r(N), 0 ... 0]
+        """
+        horizon = self.horizon
+        state_r = self.get_reference_states(trajectory)
+        return np.hstack(
             [
-                self.ref[-1].x,
-                self.ref[-1].y,
-                self.ref[-1].angle - trajectory[0].angle,
-                self.ref[-1].kappa,
+                -(self.Q @ state_r[:-1].T).T.ravel(),
+                -self.QN @ state_r[-1],
+                np.zeros(horizon * nu),
             ]
         )
 
-        q = np.hstack([q, -self.QN @ state_rn, np.zeros(horizon * nu)])
-        # print("part 2 q size:", q.shape)
+    def get_constraints(self, Ad, Bd, state0, W_0):
+        """
+        OSQP constraints: dynamics as equalities, state / input box as inequalities
+            output:
+                A, l, u
+        """
+        horizon = self.horizon
+        [nx, nu] = Bd.shape
+        u_lower = -max_kappa_rate
+        u_upper = max_kappa_rate
         # - linear equations
         Ax = sp.kron(sp.eye(horizon + 1), -sp.eye(nx)) + sp.kron(
             sp.eye(horizon + 1, k=-1), Ad
         )
         Bu = sp.kron(sp.vstack([sp.csc_matrix((1, horizon)), sp.eye(horizon)]), Bd)
         Aeq = sp.hstack([Ax, Bu])
-        beq = np.zeros(horizon * nx + horizon * nu)
         leq = np.hstack([-state0, np.zeros(horizon * nx)]) - np.kron(
             np.ones(horizon + 1), W_0
         )
@@ -137,21 +265,330 @@ class LatKmMpc_Controller:
                 np.kron(np.ones(horizon), u_upper),
             ]
         )
-        # print("Aeq size:", Aeq.shape, "Aineq size:", Aineq.shape, "lineq size:", lineq.shape, "uineq size:", uineq.shape)
-        # OSQP constraints
-        A = sp.vstack([Aeq, Aineq])
+        A = sp.vstack([Aeq, Aineq], format="csc")
         l = np.hstack([leq, lineq])
         u = np.hstack([ueq, uineq])
+        return A, l, u
+
+    def get_cost_matrix(self):
+        horizon = self.horizon
+        return sp.block_diag(
+            [
+                sp.kron(sp.eye(horizon), self.Q),
+                self.QN,
+                sp.kron(sp.eye(horizon), self.R),
+            ],
+            format="csc",
+        )
+
+    def Update(self, init_status: vehicle_status, trajectory) -> float:
+        """
+        Calculate the control command using Kinematic model and OSQP.
+
+        more details:
+
+            https://github.com/osqp/osqp
+
+        input:
+            init_status: initial status
+            trajectory: reference trajectory
+
+        output:
+            control command[ kappa rate]
+        """
+        self.init_status = init_status
+        self.ref = trajectory  # update reference
+        if self.gain_table is not None:
+            with span("mpc.gain_table"):
+                U = self.predict_from_gain_table(init_status, trajectory)
+            if U is not None:
+                self.lateral_cmd = U[0]
+                return U[0]
+        if self.formulation == "condensed":
+            return self.update_condensed(init_status, trajectory)
+        if self.solver == "banded":
+            return self.update_banded(init_status, trajectory)
+        if self.persistent:
+            return self.update_persistent(init_status, trajectory)
+        horizon = self.horizon
+        with span("mpc.assembly"):
+            state0, W_0, Ad, Bd = self.get_model(init_status)
+            [nx, nu] = Bd.shape
+            # construct the cost
+            P = self.get_cost_matrix()
+            q = self.get_cost_vector(trajectory, nu)
+            # OSQP constraints
+            A, l, u = self.get_constraints(Ad, Bd, state0, W_0)
         # Create an OSQP object
         prob = osqp.OSQP()
 
-        prob.setup(P, q, A, l, u, warm_start=True, verbose=False)
-        res = prob.solve()
+        with span("mpc.setup"):
+            prob.setup(P, q, A, l, u, warm_start=True, verbose=False)
+        with span("mpc.solve"):
+            res = prob.solve()
         # get control
         ctrl = res.x[-horizon * nu : -(horizon - 1) * nu]
         self.lateral_cmd = ctrl[0]
         return ctrl[0]
 
+    def get_Ad_values(self, init_status: vehicle_status):
+        """
+        values of Ad_dynamic_entries for every step of the horizon
+        """
+        v0 = init_status.velocity
+        theta0 = init_status.theta
+        entries = np.array(
+            [-v0 * sin(theta0) * self.ts, v0 * cos(theta0) * self.ts, v0 * self.ts]
+        )
+        return np.tile(entries, self.horizon)[self.Ax_order]
+
+    def setup_workspace(self, init_status: vehicle_status, trajectory):
+        """
+        set up the OSQP problem once per (horizon, ts, weights).
+
+        Ad is built with every v0 / theta0 dependent entry stored explicitly,
+        so the sparsity pattern of A never changes and later cycles only
+        push new q, l, u and Ax through prob.update().
+        """
+        with span("mpc.assembly"):
+            P, q, A, l, u = self.get_workspace_qp(init_status, trajectory)
+        self.prob = osqp.OSQP()
+        with span("mpc.setup"):
+            self.prob.setup(P, q, A, l, u, warm_start=True, verbose=False)
+        self.prob_key = self.get_workspace_key()
+        self.l_buffer = l.copy()
+        self.u_buffer = u.copy()
+        self.last_solution = None
+
+    def get_workspace_qp(self, init_status: vehicle_status, trajectory):
+        """
+        QP data with a fixed sparsity pattern, sets Ax_idx / Ax_order
+            output:
+                P, q, A, l, u
+        """
+        horizon = self.horizon
+        state0, W_0, _, Bd = self.get_model(init_status)
+        [nx, nu] = Bd.shape
+        Ad_pattern = np.eye(nx)
+        for row, col in self.Ad_dynamic_entries:
+            Ad_pattern[row, col] = 1.0  # placeholder, overwritten below
+        A, l, u = self.get_constraints(sp.csc_matrix(Ad_pattern), Bd, state0, W_0)
+        A = sp.csc_matrix(A)
+        A.sort_indices()
+        # locate the Ad entries of every block in A.data
+        Ax_idx = []
+        for k in range(horizon):
+            for row, col in self.Ad_dynamic_entries:
+                row_A = (k + 1) * nx + row
+                col_A = k * nx + col
+                start, end = A.indptr[col_A], A.indptr[col_A + 1]
+                Ax_idx.append(start + np.searchsorted(A.indices[start:end], row_A))
+        Ax_idx = np.array(Ax_idx)
+        self.Ax_order = np.argsort(Ax_idx)
+        self.Ax_idx = Ax_idx[self.Ax_order]
+        A.data[self.Ax_idx] = self.get_Ad_values(init_status)
+
+        P = sp.csc_matrix(self.get_cost_matrix())
+        q = self.get_cost_vector(trajectory, nu)
+        return P, q, A, l, u
+
+    def get_weights_key(self):
+        """
+        (horizon, ts, R, Q, QN) as hashable values. The dense bytes of Q / QN
+        are only rebuilt when a weight, the horizon or ts was replaced, so
+        the per cycle check is a few comparisons. Weights are replaced, not
+        edited in place.
+        """
+        inputs = (self.horizon, self.ts, float(self.R))
+        cached = self.weights_key
+        if cached is None or cached[0] != inputs or cached[1] is not self.Q or cached[2] is not self.QN:
+            key = inputs + (self.Q.toarray().tobytes(), self.QN.toarray().tobytes())
+            self.weights_key = cached = (inputs, self.Q, self.QN, key)
+        return cached[3]
+
+    def get_workspace_key(self):
+        """
+        what a workspace was set up for: formulation, solver and weights
+        """
+        return (self.formulation, self.solver) + self.get_weights_key()
+
+    def update_persistent(self, init_status: vehicle_status, trajectory) -> float:
+        """
+        same problem as Update, solved on a persistent OSQP workspace.
+        """
+        horizon = self.horizon
+        nx, nu = 4, 1
+        if self.prob is None or self.prob_key != self.get_workspace_key():
+            self.setup_workspace(init_status, trajectory)
+        else:
+            with span("mpc.assembly"):
+                state0, W_0 = self.get_initial_state(init_status)
+                leq = np.hstack([-state0, np.zeros(horizon * nx)]) - np.kron(
+                    np.ones(horizon + 1), W_0
+                )
+                n_eq = leq.shape[0]
+                l = self.l_buffer
+                u = self.u_buffer
+                l[:n_eq] = leq
+                u[:n_eq] = leq
+                q = self.get_cost_vector(trajectory, nu)
+                Ax = self.get_Ad_values(init_status)
+            with span("mpc.update"):
+                self.prob.update(q=q, l=l, u=u, Ax=Ax, Ax_idx=self.Ax_idx)
+            if self.last_solution is not None:
+                # shift the previous solution one step forward
+                n_state = (horizon + 1) * nx
+                X = self.last_solution[:n_state].reshape(horizon + 1, nx)
+                U = self.last_solution[n_state:]
+                self.prob.warm_start(
+                    x=np.hstack([X[1:].ravel(), X[-1], U[1:], U[-1:]])
+                )
+        with span("mpc.solve"):
+            res = self.prob.solve()
+        if res.x is not None and np.all(np.isfinite(res.x)):
+            self.last_solution = res.x
+        ctrl = res.x[-horizon * nu : -(horizon - 1) * nu]
+        self.lateral_cmd = ctrl[0]
+        return ctrl[0]
+
+    def get_condensed_qp(self, init_status: vehicle_status, trajectory):
+        """
+        condensed QP over the kappa rates only,
+            min 0.5 U' H U + f' U,  s.t. |U| <= max_kappa_rate
+            output:
+                H, f
+        """
+        horizon = self.horizon
+        nx = self.prediction.nx
+        state0, W_0 = self.get_initial_state(init_status)
+        Phi, Gamma, Psi = self.prediction.update(
+            init_status.velocity, init_status.theta
+        )
+        X_free = Phi @ state0 + Psi @ W_0
+        q_x = self.get_cost_vector(trajectory)[: (horizon + 1) * nx]
+        Q_Gamma = self.Q_bar @ Gamma
+        H = Gamma.T @ Q_Gamma + self.R * np.eye(horizon)
+        f = Q_Gamma.T @ X_free + Gamma.T @ q_x
+        return H, f
+
+    def setup_condensed(self, init_status: vehicle_status, trajectory):
+        """
+        set up the condensed OSQP problem once per (horizon, ts, weights),
+        H is stored as a dense upper triangle so it can be refreshed in place.
+        """
+        horizon = self.horizon
+        self.prediction = condensed_prediction(self.ts, horizon)
+        self.Q_bar = sp.block_diag(
+            [sp.kron(sp.eye(horizon), self.Q), self.QN], format="csr"
+        ).toarray()
+        H_pattern = sp.csc_matrix(np.triu(np.ones((horizon, horizon))))
+        self.Px_rows = H_pattern.indices
+        self.Px_cols = np.repeat(np.arange(horizon), np.diff(H_pattern.indptr))
+        with span("mpc.assembly"):
+            H, f = self.get_condensed_qp(init_status, trajectory)
+        H_pattern.data = H[self.Px_rows, self.Px_cols]
+        A = sp.eye(horizon, format="csc")
+        l = np.full(horizon, -max_kappa_rate)
+        u = np.full(horizon, max_kappa_rate)
+        self.prob = osqp.OSQP()
+        with span("mpc.setup"):
+            self.prob.setup(H_pattern, f, A, l, u, warm_start=True, verbose=False)
+        self.prob_key = self.get_workspace_key()
+        self.last_solution = None
+
+    def update_condensed(self, init_status: vehicle_status, trajectory) -> float:
+        """
+        same problem as Update, with only the horizon kappa rates as variables.
+        """
+        if self.prob is None or self.prob_key != self.get_workspace_key():
+            self.setup_condensed(init_status, trajectory)
+        else:
+            with span("mpc.assembly"):
+                H, f = self.get_condensed_qp(init_status, trajectory)
+            with span("mpc.update"):
+                self.prob.update(q=f, Px=H[self.Px_rows, self.Px_cols])
+            if self.last_solution is not None:
+                U = self.last_solution
+                self.prob.warm_start(x=np.hstack([U[1:], U[-1:]]))
+        with span("mpc.solve"):
+            res = self.prob.solve()
+        if res.x is not None and np.all(np.isfinite(res.x)):
+            self.last_solution = res.x
+        self.lateral_cmd = res.x[0]
+        return res.x[0]
+
+    def update_banded(self, init_status: vehicle_status, trajectory) -> float:
+        """
+        same problem as Update, solved by the banded interior point solver
+        whose cost grows linearly with the horizon.
+        """
+        horizon = self.horizon
+        nx, nu = 4, 1
+        if self.banded is None or self.prob_key != self.get_workspace_key():
+            self.banded = banded_ipm_solver(
+                horizon,
+                self.Q.toarray(),
+                self.QN.toarray(),
+                np.array([[self.R]]),
+                nx,
+                nu,
+            )
+            self.prob_key = self.get_workspace_key()
+        with span("mpc.assembly"):
+            state0, W_0, Ad, Bd = self.get_dense_model(init_status)
+            q = self.get_cost_vector(trajectory, nu)[: (horizon + 1) * nx]
+            self.banded.set_model(Ad, Bd)
+        # x_0 = state0 + W_0, x_k+1 = Ad x_k + Bd u_k + W_0
+        with span("mpc.solve"):
+            U, _ = self.banded.solve(
+                state0 + W_0,
+                W_0,
+                q.reshape(horizon + 1, nx),
+                -max_kappa_rate,
+                max_kappa_rate,
+            )
+        self.lateral_cmd = U[0, 0]
+        return U[0, 0]
+
+    def set_gain_table(self, gain_table):
+        """
+        use a precomputed mpc_gain_table as the fast path of Update
+        """
+        if gain_table.key() != self.get_weights_key():
+            raise ValueError("gain table was built for other (horizon, ts, weights)")
+        self.gain_table = gain_table
+
+    def predict_from_gain_table(self, init_status: vehicle_status, trajectory):
+        """
+        unconstrained kappa rates from the gain table,
+        None when the table does not apply or the bounds would be violated
+        """
+        stats = self.gain_table_stats
+        if self.gain_table.key() != self.get_weights_key():
+            stats["out_of_grid"] += 1  # weights changed since the table was set
+            return None
+        state0, _ = self.get_initial_state(init_status)
+        U = self.gain_table.predict(
+            init_status.velocity,
+            init_status.theta,
+            state0,
+            self.get_reference_states(trajectory),
+        )
+        if U is None:
+            stats["out_of_grid"] += 1
+            return None
+        if np.any(np.abs(U) > max_kappa_rate):
+            stats["bound"] += 1
+            return None
+        stats["hit"] += 1
+        return U
+
+    def get_gain_table_stats(self):
+        stats = dict(self.gain_table_stats)
+        total = sum(stats.values())
+        stats["hit_ratio"] = stats["hit"] / total if total > 0 else 0.0
+        return stats
+
     def get_ref_points(self, ref_points: list):
         """
         get reference points
@@ -206,7 +643,7 @@ if __name__ == "__main__":
     trajectory = ref_lin.get_ref_points(planner_t * ego.velocity)
 
     controller = LatKmMpc_Controller(ts, horizon)
-    nearest_point = ref_lin.get_nearest_point(ego.X, ego.Y)
+    nearest_point = ref_lin.get_nearest_point(ego.X, ego.Y, key=ego.name)
 
     ts = controller.ts
     horizon = controller.horizon
@@ -216,4 +653,33 @@ if __name__ == "__main__":
         control_ref.append(ref_lin.get_point_from_S(nearest_point, ds[i]))
     print(controller.Update(ego.get_vehicle_status(), control_ref))
 
+    ### per-step timing: rebuild vs persistent workspace vs condensed ###
+    controllers = {
+        "rebuild": LatKmMpc_Controller(ts, horizon),
+        "persistent": LatKmMpc_Controller(ts, horizon, persistent=True),
+        "condensed": LatKmMpc_Controller(ts, horizon, formulation="condensed"),
+        "banded": LatKmMpc_Controller(ts, horizon, solver="banded"),
+    }
+    step_time = {key: [] for key in controllers}
+    cmd_diff = {key: [] for key in controllers}
+    for step in range(100):
+        nearest_point = ref_lin.get_nearest_point(ego.X, ego.Y, key=ego.name)
+        ds = ego.velocity * ts * np.arange(horizon)
+        control_ref = ref_lin.get_points_from_S(nearest_point, ds)
+        status = ego.get_vehicle_status()
+        cmd = {}
+        for key, mpc in controllers.items():
+            t0 = time.perf_counter()
+            cmd[key] = mpc.Update(status, control_ref)
+            step_time[key].append(time.perf_counter() - t0)
+            cmd_diff[key].append(abs(cmd[key] - cmd["rebuild"]))
+        ego.kinematic_Update(kappa_rate=cmd["rebuild"], acceleration=0.0, dt=ts)
+    for key in controllers:
+        # the first step of a persistent workspace includes the one-off setup
+        print(
+            f"{key:<10} : {np.mean(step_time[key][1:]) * 1e3:.3f} ms/step "
+            f"(first step {step_time[key][0] * 1e3:.3f} ms), "
+            f"max |cmd diff| {max(cmd_diff[key]):.2e}"
+        )
+
     print("pause")
@@ -1,131 +1,259 @@
-from vehicle_model import vehicle_model, vehicle_status
+import sys
+import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.widgets import Cursor, Slider
-from referenceline import (
-    reference_line,
-    straight_road,
-    left_curve_road,
-    right_curve_road,
-)
-from controller import LongPid_Controller, LatKmMpc_Controller, ts, horizon
-from object import object, detect_sensor
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import Polygon
+from referenceline import reference_line
 from utilities import *
-from typing import List, Dict
-from proto import sim_debug_pb2
-from replay_data import sim_data_recorder, sim_data_player
+from simulation import Simulation, make_default_simulation
+from object import object
+from replay_data import sim_stream_recorder, sim_data_player
 
 
-######### recorder creation #######
-debugger = sim_debug_pb2.sim_debug()
-vehicle_state_debug = sim_debug_pb2.vehicle_state_debug()
-controller_debug = sim_debug_pb2.controller_debug()
-recorder = sim_data_recorder("test")
-player = sim_data_player()
-if __name__ == "__main__":
-    #########objects creation##### 
-    ref_lin = straight_road  # create a reference line
-    ego = vehicle_model("ego", 0.01, 0.002, 15.0, -4, 0, 40)  # create a vehicle model
-    sensor = detect_sensor(ego)  # equipment sensor in ego vehicle
-    sensor.register_object(object("car", 1.9, 5.0, 20.0, 100.0 / 3.6, ref_lin, 2.0))
-    sensor.register_ref_line(ref_lin)
-    trajectory = ref_lin.get_ref_points(field_size["x_max"])  # get reference line
-
-    lat_controller = LatKmMpc_Controller(ts, horizon)  # create a lateral controller
-    lon_controller = LongPid_Controller(1.5, 30.0)
-    #########figure setup#########
-    fig, ax = plt.subplots()
-    fig.canvas.manager.set_window_title("Spark Group Simulation Platform")
-    # fig.canvas.manager.
-    fig.tight_layout()
-    ax.set_facecolor("lightgreen")
-    ax.set_xlim(field_size["x_min"], field_size["x_max"])
-    ax.set_ylim(field_size["y_min"], field_size["y_max"])
-    plt.ion()  # 开启 交互模式
-    show_start_message(ax=ax)
-    plt.pause(2.0)
-    ax.cla()
-    #########trajectory##########
-    traj_x = [p.x for p in trajectory]
-    traj_y = [p.y for p in trajectory]
-    #############################
-    ####### data container ######
-    Hist_Sts: List[vehicle_status] = []
-    Hist_Cmd: Dict[str, list] = {"k_r_cmd": [], "accel_cmd": []}
-    time: List[float] = []
-    ####### simulation loop ######
-    for i in range(50):
+class sim_renderer:
+    """
+    matplotlib observer of a Simulation, draws every step
+    """
+
+    def __init__(self, ax, trajectory, pause: float = 0.1, verbose: bool = True):
+        self.ax = ax
+        self.traj_x = trajectory.x
+        self.traj_y = trajectory.y
+        self.pause = pause
+        self.verbose = verbose
+
+    def __call__(self, sim: Simulation):
+        ax = self.ax
+        ego = sim.ego
         # set x-axis from -10 to 10
         ax.set_xlim(field_size["x_min"], field_size["x_max"])
         ax.set_ylim(field_size["y_min"], field_size["y_max"])
 
-        plt.scatter(traj_x, traj_y, s=1, c="r")  # draw reference line in global frame
-        show_time(ax=ax, loc_x=0.05, loc_y=0.95, time=i * ts)  # show time
+        plt.scatter(self.traj_x, self.traj_y, s=1, c="r")  # draw reference line in global frame
+        show_time(ax=ax, loc_x=0.05, loc_y=0.95, time=sim.time)  # show time
         show_info(
             ax=ax,
             loc_x=0.05,
             loc_y=80,
             info=f"$v$ : {ego.velocity: 0.2e}, m/s \n"
             + f"$a$ :  {ego.acceleration: 0.2e} m/s^2 \n"
-            + f"$\kappa$ :   {ego.kappa:0.2e} 1/m \n",
+            + f"$\\kappa$ :   {ego.kappa:0.2e} 1/m \n",
         )
         ######## plot vehicle #####
         ego.plot_vehicle(ax=ax)
-        sensor.plot_targets(ax=ax)
+        sim.sensor.plot_targets(ax=ax)
+        #### nearest point and control reference point #####
+        plt.scatter(sim.nearest_point.x, sim.nearest_point.y, s=5, c="g")
+        plt.scatter(sim.control_ref.x, sim.control_ref.y, s=10, c="b")
+        if self.verbose:
+            print(
+                "kappa_rate : ", sim.kappa_rate, " acceleration : ", sim.acceleration
+            )  # print control command
+        #### pause for visualization #####
+        if self.pause > 0:
+            plt.pause(self.pause)
+        else:  # plt.pause(0) would block, just draw
+            ax.figure.canvas.draw_idle()
+            ax.figure.canvas.flush_events()
+        ax.cla()  # 清空画布
+
+
+class sim_blit_renderer:
+    """
+    matplotlib observer of a Simulation with persistent artists
+
+    Artists are created once on the first step. The static scene (axes,
+    reference line) is drawn a single time and cached as background, every
+    step restores it and only redraws the moving artists: ego polygon, one
+    PolyCollection for all objects, scatter offsets and texts. The cost of
+    a frame no longer depends on the number of artists that were ever drawn.
+    """
+
+    def __init__(self, ax, trajectory, pause: float = 0.1, verbose: bool = True):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.traj_x = trajectory.x
+        self.traj_y = trajectory.y
+        self.pause = pause
+        self.verbose = verbose
+        self.background = None
+        self.artists = None
+        self.draw_cid = None
+
+    def setup(self):
+        """
+        create all artists, moving ones are animated and left to blitting
+        """
+        ax = self.ax
+        ax.set_xlim(field_size["x_min"], field_size["x_max"])
+        ax.set_ylim(field_size["y_min"], field_size["y_max"])
+        ax.scatter(self.traj_x, self.traj_y, s=1, c="r")  # static reference line
+        ego = Polygon(
+            np.zeros((4, 2)),
+            linewidth=2,
+            edgecolor="blue",
+            facecolor="lightblue",
+            alpha=0.7,
+            animated=True,
+        )
+        ax.add_patch(ego)
+        targets = PolyCollection(
+            [], linewidth=2, edgecolor="red", facecolor="red", alpha=0.7, animated=True
+        )
+        ax.add_collection(targets, autolim=False)
+        nearest = ax.scatter([], [], s=5, c="g", animated=True)
+        control_ref = ax.scatter([], [], s=10, c="b", animated=True)
+        time_text = ax.text(0.05, 0.95, "", size=10, animated=True)
+        info_text = ax.text(0.05, 80, "", size=10, animated=True)
+        self.artists = dict(
+            ego=ego,
+            targets=targets,
+            nearest=nearest,
+            control_ref=control_ref,
+            time=time_text,
+            info=info_text,
+        )
+        # a resize or any full redraw invalidates the cached background
+        self.draw_cid = self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.canvas.draw()
 
-        #### find nearest point ######
-        nearest_point = ref_lin.get_nearest_point(ego.X, ego.Y)  # get nearest point
-        plt.scatter(nearest_point.x, nearest_point.y, s=5, c="g")  # draw nearest point
+    def on_draw(self, event=None):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_artists()
 
-        #### get control reference point #####
-        ds = [ego.velocity * ts * i for i in range(horizon)]
-        control_ref = []
-        control_ref.extend(
-            ref_lin.get_point_from_S(nearest_point, ds[i]) for i in range(horizon)
+    def draw_artists(self):
+        for artist in self.artists.values():
+            self.ax.draw_artist(artist)
+
+    def update_artists(self, frame: dict):
+        """
+        input:
+            frame: Simulation.snapshot of the step to draw
+        """
+        artists = self.artists
+        artists["ego"].set_xy(frame["ego"])
+        artists["targets"].set_verts(frame["targets"])
+        artists["nearest"].set_offsets(frame["nearest"][None, :])
+        artists["control_ref"].set_offsets(frame["control_ref"])
+        artists["time"].set_text(f"t = {frame['time']:.1f}")
+        # plain text, mathtext would be parsed again for every new value
+        artists["info"].set_text(
+            f"v : {frame['velocity']: 0.2e}, m/s \n"
+            + f"a :  {frame['acceleration']: 0.2e} m/s² \n"
+            + f"κ :   {frame['kappa']:0.2e} 1/m \n"
         )
-        ego_status = ego.get_vehicle_status()
-
-        #### update controller and get control command #####
-        kappa_rate = lat_controller.Update(ego_status, control_ref)
-        acceleration = lon_controller.Update(ego, sensor.get_object_by_name("car"))
-        print(
-            "kappa_rate : ", kappa_rate, " acceleration : ", acceleration
-        )  # print control command
-
-        #### plot control reference point #####
-        control_ref_x = [pt.x for pt in control_ref]
-        control_ref_y = [pt.y for pt in control_ref]
-        plt.scatter(control_ref_x, control_ref_y, s=10, c="b")
-        #### store ego status #####
-        ego.debug_proto(debug_proto=vehicle_state_debug)
-        #### store control command #####
-        lat_controller.debug_proto(debug_proto=controller_debug)
-        lon_controller.debug_proto(debug_proto=controller_debug)
-        debugger.times.append(i * ts)
-        debugger.vehicle_state_debug.append(vehicle_state_debug)    
-        debugger.controller_debug.append(controller_debug)
-        ##### kinematic model update #####
-        ego.kinematic_Update(
-            kappa_rate=kappa_rate, acceleration=acceleration, dt=ts
-        )  # update kinematic model
-        #### sensor update #####
-        sensor.Update(ts)
 
+    def render_frame(self, frame: dict):
+        """
+        draw one frame into the canvas buffer, without showing it
+        """
+        if self.artists is None:
+            self.setup()
+        self.update_artists(frame)
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+
+    def __call__(self, sim: Simulation):
+        self.render_frame(sim.snapshot())
+        self.canvas.blit(self.ax.bbox)
+        if self.verbose:
+            print(
+                "kappa_rate : ", sim.kappa_rate, " acceleration : ", sim.acceleration
+            )  # print control command
         #### pause for visualization #####
-        plt.pause(0.1)
-        ax.cla()  # 清空画布
+        if self.pause > 0:
+            self.canvas.start_event_loop(self.pause)
+        else:  # start_event_loop(0) would block
+            self.canvas.flush_events()
+
+    def close(self):
+        """
+        back to the plain artists, e.g. before drawing the end message
+        """
+        if self.draw_cid is not None:
+            self.canvas.mpl_disconnect(self.draw_cid)
+        for artist in self.artists.values():
+            artist.set_animated(False)
+        self.draw_cid = None
 
-    plt.ioff()
-    ax.set_xlim(-10, 200)
-    ax.set_ylim(-10, 100)
-    show_end_message(ax)
-    #####################################
-    ############# Save Data #############
-    #####################################
-    
-    recorder.save_data(debugger)
-    plt.close()
-    player.analyze_data()
 
+if __name__ == "__main__":
+    from referenceline import straight_road
+
+    if sys.argv[1:] == ["benchmark"]:
+        ### frame rate against scene size, redraw everything vs blitting ###
+        import time
+
+        def timed(renderer, frame_times):
+            def observer(sim):
+                t0 = time.perf_counter()
+                renderer(sim)
+                frame_times.append(time.perf_counter() - t0)
+
+            return observer
+
+        print(f"backend {plt.get_backend()}, rendering time only")
+        print("objects   redraw [fps]   blit [fps]")
+        trajectory = straight_road.get_ref_points(field_size["x_max"])
+        for n_objects in (1, 100, 1000):
+            fps = []
+            for renderer_type in (sim_renderer, sim_blit_renderer):
+                sim = make_default_simulation()
+                for i in range(1, n_objects):
+                    sim.sensor.register_object(
+                        object(
+                            f"car_{i}",
+                            1.9,
+                            5.0,
+                            10.0 + 200.0 * i / n_objects,
+                            20.0,
+                            straight_road,
+                            -20.0 + 40.0 * (i % 8) / 8,
+                        )
+                    )
+                fig, ax = plt.subplots()
+                frame_times = []
+                renderer = renderer_type(ax, trajectory, pause=0.0, verbose=False)
+                sim.add_observer(timed(renderer, frame_times))
+                sim.run(30)
+                plt.close(fig)
+                # the first frame includes the one-off artist setup
+                fps.append(1.0 / np.mean(frame_times[1:]))
+            print(f"{n_objects:>7} {fps[0]:>14.1f} {fps[1]:>12.1f}")
+    else:
+        ######### recorder creation #######
+        recorder = sim_stream_recorder("test").open()  # every step goes to disk
+        player = sim_data_player()
+        #########objects creation#####
+        ref_lin = straight_road  # create a reference line
+        sim = make_default_simulation(ref_lin, recorder)
+        trajectory = ref_lin.get_ref_points(field_size["x_max"])  # get reference line
+        #########figure setup#########
+        fig, ax = plt.subplots()
+        fig.canvas.manager.set_window_title("Spark Group Simulation Platform")
+        # fig.canvas.manager.
+        fig.tight_layout()
+        ax.set_facecolor("lightgreen")
+        ax.set_xlim(field_size["x_min"], field_size["x_max"])
+        ax.set_ylim(field_size["y_min"], field_size["y_max"])
+        plt.ion()  # 开启 交互模式
+        show_start_message(ax=ax)
+        plt.pause(2.0)
+        ax.cla()
+        ####### simulation loop ######
+        renderer = sim_blit_renderer(ax, trajectory)
+        sim.add_observer(renderer)
+        sim.run(50)
 
+        renderer.close()
+        plt.ioff()
+        ax.set_xlim(-10, 200)
+        ax.set_ylim(-10, 100)
+        show_end_message(ax)
+        #####################################
+        ############# Save Data #############
+        #####################################
 
-    
\ No newline at end of file
+        recorder.close()
+        plt.close()
+        player.analyze_data()
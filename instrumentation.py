@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+from array import array
+import numpy as np
+
+# span_tracer that span() records into, None when instrumentation is off
+tracer = None
+
+
+class null_span:
+    """
+    what span() returns while instrumentation is off, shared and stateless
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+null = null_span()
+
+
+class timed_span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.add(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+def span(name: str):
+    """
+    time the block under name if a tracer is active:
+
+        with span("mpc.solve"):
+            res = prob.solve()
+
+    costs one function call and a no-op with block while off
+    """
+    if tracer is None:
+        return null
+    return timed_span(tracer, name)
+
+
+def activate(new_tracer):
+    """
+    make new_tracer (or None) the active tracer, returns the previous one
+    """
+    global tracer
+    previous = tracer
+    tracer = new_tracer
+    return previous
+
+
+class span_tracer:
+    """
+    Records named spans as (name, start, end) in nanoseconds of
+    time.perf_counter_ns, aggregates them per name and exports them as
+    Chrome trace events (chrome://tracing, ui.perfetto.dev).
+    """
+
+    def __init__(self):
+        self.names = []
+        self.name_ids = {}
+        self.event_names = array("i")
+        self.starts = array("q")
+        self.ends = array("q")
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+
+    def __enter__(self):
+        self.previous = activate(self)
+        return self
+
+    def __exit__(self, *args):
+        activate(self.previous)
+        return False
+
+    def __len__(self):
+        return len(self.event_names)
+
+    def add(self, name: str, start: int, end: int):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        self.event_names.append(name_id)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def clear(self):
+        self.names = []
+        self.name_ids = {}
+        self.event_names = array("i")
+        self.starts = array("q")
+        self.ends = array("q")
+
+    def get_durations(self, name: str) -> np.ndarray:
+        """
+        durations of every span called name in seconds
+        """
+        name_ids = np.frombuffer(self.event_names, dtype=np.int32)
+        mask = name_ids == self.name_ids.get(name, -1)
+        starts = np.frombuffer(self.starts, dtype=np.int64)[mask]
+        ends = np.frombuffer(self.ends, dtype=np.int64)[mask]
+        return (ends - starts) * 1e-9
+
+    def get_stats(self) -> dict:
+        """
+        per span name: count, total, mean, p50, p95, p99 in seconds
+        """
+        stats = {}
+        for name in self.names:
+            durations = self.get_durations(name)
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+            stats[name] = dict(
+                count=durations.size,
+                total=float(durations.sum()),
+                mean=float(durations.mean()),
+                p50=float(p50),
+                p95=float(p95),
+                p99=float(p99),
+            )
+        return stats
+
+    def print_stats(self):
+        stats = self.get_stats()
+        width = max([len(name) for name in stats] + [4])
+        print(
+            f"{'span':<{width}} {'count':>7} {'total [ms]':>11}"
+            f" {'p50 [us]':>9} {'p95 [us]':>9} {'p99 [us]':>9}"
+        )
+        for name, item in sorted(stats.items(), key=lambda x: -x[1]["total"]):
+            print(
+                f"{name:<{width}} {item['count']:>7} {item['total'] * 1e3:>11.1f}"
+                f" {item['p50'] * 1e6:>9.1f} {item['p95'] * 1e6:>9.1f}"
+                f" {item['p99'] * 1e6:>9.1f}"
+            )
+
+    def save_chrome_trace(self, file_name: str):
+        """
+        complete ("X") events in microseconds, nested spans show up stacked
+        """
+        starts = np.frombuffer(self.starts, dtype=np.int64)
+        ends = np.frombuffer(self.ends, dtype=np.int64)
+        t0 = int(starts.min()) if starts.size else 0
+        events = [
+            {
+                "name": self.names[name_id],
+                "cat": self.names[name_id].split(".")[0],
+                "ph": "X",
+                "ts": (start - t0) / 1e3,
+                "dur": (end - start) / 1e3,
+                "pid": self.pid,
+                "tid": self.tid,
+            }
+            for name_id, start, end in zip(self.event_names, starts.tolist(), ends.tolist())
+        ]
+        with open(file_name, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import timeit
+    from replay_data import sim_stream_recorder, sim_data_player
+    from simulation import make_default_simulation
+
+    n_steps = 1000
+    folder = tempfile.mkdtemp()
+
+    ### cost of instrumentation, off vs on ###
+    n_spans = 9 + 3  # Simulation.step + LatKmMpc_Controller
+    t_null = min(timeit.repeat('with span("x"): pass', globals=globals(), number=100000))
+    step_rate = {}
+    for name, tracer_ in (("off", None), ("on", span_tracer())):
+        sim = make_default_simulation(tracer=tracer_)
+        sim.run(20)  # warm up, workspaces and caches
+        t0 = time.perf_counter()
+        sim.run(n_steps)
+        step_rate[name] = n_steps / (time.perf_counter() - t0)
+    step_time = 1.0 / step_rate["off"]
+    print(f"step rate, instrumentation off : {step_rate['off']:.1f} steps/s")
+    print(f"step rate, instrumentation on  : {step_rate['on']:.1f} steps/s")
+    print(
+        f"disabled span : {t_null / 100000 * 1e9:.0f} ns,"
+        f" {n_spans * t_null / 100000 / step_time * 100:.2f} % of a step"
+    )
+
+    ### per stage percentiles, Chrome trace, step_times column ###
+    recording = os.path.join(folder, "traced.simlog")
+    tracer_ = span_tracer()
+    with sim_stream_recorder("traced").open(recording) as recorder:
+        make_default_simulation(recorder=recorder, tracer=tracer_).run(n_steps)
+    tracer_.print_stats()
+    trace_file = os.path.join(folder, "trace.json")
+    tracer_.save_chrome_trace(trace_file)
+    step_times = sim_data_player().open(recording).read(0.0, np.inf)["step_times"]
+    assert np.allclose(step_times, tracer_.get_durations("sim.step"), rtol=1e-6)
+    print(f"chrome trace : {trace_file}")
+    print(f"recording    : {recording}, step_times p99 {np.percentile(step_times, 99) * 1e3:.2f} ms")
@@ -0,0 +1,218 @@
+import numpy as np
+import osqp
+import scipy.sparse as sp
+from controller import LatKmMpc_Controller
+
+
+class LatKmMpc_BatchController:
+    """
+    Lateral kinematic MPC for many agents in one OSQP call.
+
+    The per agent problems of LatKmMpc_Controller are independent, so they
+    are stacked into one block diagonal QP. The workspace is set up once per
+    (agent count, horizon, ts, weights) and every later tick only pushes the
+    new q, l, u and Ad entries of all agents through a single prob.update().
+    """
+
+    def __init__(self, ts: float, horizon: int):
+        self.ts = ts
+        self.horizon = horizon
+        # single agent problem, source of the weights and of the block layout
+        self.template = LatKmMpc_Controller(ts, horizon)
+        self.n_agents = 0
+        self.nx = 4
+        self.nu = 1
+        self.prob = None
+        self.prob_key = None
+        self.Ax_idx = None
+        self.Ax_order = None
+        self.n_eq = 0
+        self.l_buffer = None
+        self.u_buffer = None
+        self.last_solution = None
+        # the stopping test of the stacked problem is over all agents at once,
+        # tighter than the OSQP default to keep each agent's accuracy
+        self.eps = 1e-5
+        ## controller command, one per agent ##
+        self.lateral_cmd = np.zeros(0)
+
+    def get_workspace_key(self):
+        return (self.n_agents,) + self.template.get_workspace_key()
+
+    def setup_workspace(self, status_list, trajectory_list):
+        """
+        block diagonal copy of LatKmMpc_Controller.setup_workspace
+        """
+        mpc = self.template
+        n = self.n_agents
+        mpc.ref = trajectory_list[0]
+        P, _, A, l, u = mpc.get_workspace_qp(status_list[0], trajectory_list[0])
+        # csc block diagonal keeps the column order, agent i starts at i * nnz
+        A_batch = sp.block_diag([A] * n, format="csc")
+        P_batch = sp.block_diag([P] * n, format="csc")
+        self.Ax_order = mpc.Ax_order
+        self.Ax_idx = (mpc.Ax_idx[None, :] + A.nnz * np.arange(n)[:, None]).ravel()
+        self.n_eq = (self.horizon + 1) * self.nx
+        self.l_buffer = np.tile(l, n)
+        self.u_buffer = np.tile(u, n)
+        q, Ax = self.get_batch_data(status_list, trajectory_list)
+        A_batch.data[self.Ax_idx] = Ax
+        self.prob = osqp.OSQP()
+        self.prob.setup(
+            P_batch,
+            q,
+            A_batch,
+            self.l_buffer,
+            self.u_buffer,
+            warm_start=True,
+            verbose=False,
+            eps_abs=self.eps,
+            eps_rel=self.eps,
+        )
+        self.prob_key = self.get_workspace_key()
+        self.last_solution = None
+
+    def get_batch_data(self, status_list, trajectory_list):
+        """
+        stacked q and Ax of all agents, same terms as LatKmMpc_Controller
+        get_cost_vector / get_constraints / get_Ad_values, vectorized over
+        the agents. Writes the equality bounds into l_buffer / u_buffer.
+        """
+        n, horizon, nx, nu, ts = self.n_agents, self.horizon, self.nx, self.nu, self.ts
+        mpc = self.template
+        # reference states x_r(0) ... x_r(N-1), x_r(N) = last reference point
+        state_r = np.empty((n, horizon + 1, nx))
+        angle0 = np.empty(n)
+        for i, trajectory in enumerate(trajectory_list):
+            mpc.ref = trajectory
+            state_r[i] = mpc.get_reference_states(trajectory)
+            angle0[i] = trajectory[0].angle
+        q = np.zeros((n, (horizon + 1) * nx + horizon * nu))
+        q[:, : horizon * nx] = -(state_r[:, :-1] @ mpc.Q.toarray().T).reshape(n, -1)
+        q[:, horizon * nx : (horizon + 1) * nx] = -state_r[:, -1] @ mpc.QN.toarray().T
+        # initial state and drift term
+        status = np.array(
+            [[s.x, s.y, s.theta, s.kappa, s.velocity] for s in status_list]
+        )
+        theta0, v0 = status[:, 2], status[:, 4]
+        state0 = status[:, :4].copy()
+        state0[:, 2] -= angle0
+        W_0 = np.zeros((n, nx))
+        W_0[:, 0] = v0 * np.cos(theta0)
+        W_0[:, 1] = v0 * np.sin(theta0)
+        leq = -np.tile(W_0, horizon + 1)
+        leq[:, :nx] -= state0
+        self.l_buffer.reshape(n, -1)[:, : self.n_eq] = leq
+        self.u_buffer.reshape(n, -1)[:, : self.n_eq] = leq
+        entries = np.column_stack(
+            [-v0 * np.sin(theta0) * ts, v0 * np.cos(theta0) * ts, v0 * ts]
+        )
+        Ax = np.tile(entries, (1, horizon))[:, self.Ax_order]
+        return q.ravel(), Ax.ravel()
+
+    def Update(self, status_list, trajectory_list) -> np.ndarray:
+        """
+        input:
+            status_list: initial status of every agent
+            trajectory_list: reference trajectory of every agent
+        output:
+            control command of every agent [kappa rate]
+        """
+        if len(status_list) != len(trajectory_list):
+            raise ValueError("need one reference trajectory per agent")
+        horizon, nx, nu = self.horizon, self.nx, self.nu
+        self.n_agents = len(status_list)
+        if self.n_agents == 0:
+            self.lateral_cmd = np.zeros(0)
+            return self.lateral_cmd
+        if self.prob is None or self.prob_key != self.get_workspace_key():
+            self.setup_workspace(status_list, trajectory_list)
+        else:
+            q, Ax = self.get_batch_data(status_list, trajectory_list)
+            self.prob.update(
+                q=q, l=self.l_buffer, u=self.u_buffer, Ax=Ax, Ax_idx=self.Ax_idx
+            )
+            if self.last_solution is not None:
+                # shift every agent's previous solution one step forward
+                n_state = (horizon + 1) * nx
+                x = self.last_solution.reshape(self.n_agents, -1)
+                X = x[:, :n_state].reshape(self.n_agents, horizon + 1, nx)
+                U = x[:, n_state:]
+                self.prob.warm_start(
+                    x=np.hstack(
+                        [
+                            X[:, 1:].reshape(self.n_agents, -1),
+                            X[:, -1],
+                            U[:, 1:],
+                            U[:, -1:],
+                        ]
+                    ).ravel()
+                )
+        res = self.prob.solve()
+        if res.x is not None and np.all(np.isfinite(res.x)):
+            self.last_solution = res.x
+        x = res.x.reshape(self.n_agents, -1)
+        self.lateral_cmd = x[:, -horizon * nu]
+        return self.lateral_cmd
+
+
+if __name__ == "__main__":
+    import time
+    from controller import ts, horizon
+    from referenceline import reference_line
+    from vehicle_model import vehicle_model
+
+    ### throughput against agent count, batched vs one controller per agent ###
+    ref_lin = reference_line(-5.0, 0.005, 0.0005)
+    n_steps = 30
+    # accuracy against the interior point solver, which converges much tighter
+    # than the OSQP default tolerance of the per agent controllers
+    reference = LatKmMpc_Controller(ts, horizon, solver="banded")
+    print("agents   batched [agent*steps/s]   per agent [agent*steps/s]   max |cmd - banded|")
+    for n_agents in (1, 10, 50, 100, 200):
+        rng = np.random.default_rng(0)
+        agents = [
+            vehicle_model(
+                f"agent_{i}",
+                0.0,
+                0.005,
+                rng.uniform(5.0, 20.0),
+                0.5,
+                rng.uniform(-5.0, 100.0),
+                -5.0 + rng.uniform(-2.0, 2.0),
+            )
+            for i in range(n_agents)
+        ]
+        batch = LatKmMpc_BatchController(ts, horizon)
+        single = [LatKmMpc_Controller(ts, horizon, persistent=True) for _ in agents]
+        t_batch, t_single, cmd_diff = [], [], []
+        for step in range(n_steps):
+            status_list, trajectory_list = [], []
+            for ego in agents:
+                nearest_point = ref_lin.get_nearest_point(ego.X, ego.Y, key=ego.name)
+                ds = ego.velocity * ts * np.arange(horizon)
+                trajectory_list.append(ref_lin.get_points_from_S(nearest_point, ds))
+                status_list.append(ego.get_vehicle_status())
+            t0 = time.perf_counter()
+            cmd = batch.Update(status_list, trajectory_list)
+            t1 = time.perf_counter()
+            cmd_single = [
+                mpc.Update(status, trajectory)
+                for mpc, status, trajectory in zip(single, status_list, trajectory_list)
+            ]
+            t2 = time.perf_counter()
+            t_batch.append(t1 - t0)
+            t_single.append(t2 - t1)
+            cmd_ref = [
+                reference.Update(status, trajectory)
+                for status, trajectory in zip(status_list, trajectory_list)
+            ]
+            cmd_diff.append(np.max(np.abs(cmd - cmd_ref)))
+            for ego, kappa_rate in zip(agents, cmd):
+                ego.kinematic_Update(kappa_rate=kappa_rate, acceleration=0.0, dt=ts)
+        # the first step includes the one-off workspace setup
+        print(
+            f"{n_agents:>6} {n_agents / np.mean(t_batch[1:]):>25.0f}"
+            f" {n_agents / np.mean(t_single[1:]):>27.0f}"
+            f" {max(cmd_diff):>20.1e}"
+        )
@@ -0,0 +1,195 @@
+import numpy as np
+from math import pi
+from controller import condensed_prediction, LatKmMpc_Controller
+
+
+class mpc_gain_table:
+    """
+    Explicit (gain scheduled) form of the unconstrained lateral MPC.
+
+    Without active kappa rate bounds the condensed QP has the closed form
+
+        U = -H^-1 Gamma' Q_bar (Phi state0 + Psi W_0 - X_r)
+
+    an affine law in (state0, X_r) whose gains only depend on v0 and theta0.
+    The gains are tabulated offline over a velocity / heading grid for one
+    (ts, horizon, Q, QN, R) and bilinearly interpolated at runtime.
+    """
+
+    def __init__(
+        self,
+        ts: float,
+        horizon: int,
+        Q: np.ndarray,
+        QN: np.ndarray,
+        R: float,
+        v_grid=None,
+        theta_grid=None,
+    ):
+        self.ts = ts
+        self.horizon = horizon
+        self.Q = np.ascontiguousarray(Q, dtype=float)
+        self.QN = np.ascontiguousarray(QN, dtype=float)
+        self.R = float(R)
+        self.v_grid = (
+            np.linspace(0.0, 40.0, 41) if v_grid is None else np.asarray(v_grid)
+        )
+        self.theta_grid = (
+            np.linspace(-pi, pi, 73) if theta_grid is None else np.asarray(theta_grid)
+        )
+        self.nx = self.Q.shape[0]
+        # gains[i, j] = [K_state0 | K_ref | k_const] at (v_grid[i], theta_grid[j])
+        self.gains = None
+
+    @classmethod
+    def from_controller(cls, controller: LatKmMpc_Controller, v_grid=None, theta_grid=None):
+        """
+        build the table for the current weights of a controller
+        """
+        table = cls(
+            controller.ts,
+            controller.horizon,
+            controller.Q.toarray(),
+            controller.QN.toarray(),
+            controller.R,
+            v_grid,
+            theta_grid,
+        )
+        return table.build()
+
+    def key(self):
+        """
+        same layout as LatKmMpc_Controller.get_weights_key
+        """
+        return (self.horizon, self.ts, self.R, self.Q.tobytes(), self.QN.tobytes())
+
+    def build(self):
+        """
+        tabulate the affine feedback law over the velocity / heading grid
+        """
+        nx, N = self.nx, self.horizon
+        n = (N + 1) * nx
+        prediction = condensed_prediction(self.ts, N, nx)
+        Q_bar = np.zeros((n, n))
+        for k in range(N):
+            Q_bar[k * nx : (k + 1) * nx, k * nx : (k + 1) * nx] = self.Q
+        Q_bar[N * nx :, N * nx :] = self.QN
+        self.gains = np.empty((self.v_grid.size, self.theta_grid.size, N, nx + n + 1))
+        for i, v0 in enumerate(self.v_grid):
+            for j, theta0 in enumerate(self.theta_grid):
+                Phi, Gamma, Psi = prediction.update(v0, theta0)
+                W_0 = np.array([v0 * np.cos(theta0), v0 * np.sin(theta0), 0.0, 0.0])
+                H = Gamma.T @ Q_bar @ Gamma + self.R * np.eye(N)
+                G = np.linalg.solve(H, Gamma.T @ Q_bar)
+                self.gains[i, j, :, :nx] = -G @ Phi
+                self.gains[i, j, :, nx : nx + n] = G
+                self.gains[i, j, :, -1] = -G @ Psi @ W_0
+        return self
+
+    def lookup(self, v0: float, theta0: float):
+        """
+        bilinear interpolation of the gains, None outside the velocity grid
+        """
+        v_grid, theta_grid = self.v_grid, self.theta_grid
+        if not v_grid[0] <= v0 <= v_grid[-1]:
+            return None
+        theta0 = (theta0 + pi) % (2 * pi) - pi
+        if not theta_grid[0] <= theta0 <= theta_grid[-1]:
+            return None
+        i = min(np.searchsorted(v_grid, v0, side="right") - 1, v_grid.size - 2)
+        j = min(np.searchsorted(theta_grid, theta0, side="right") - 1, theta_grid.size - 2)
+        t = (v0 - v_grid[i]) / (v_grid[i + 1] - v_grid[i])
+        u = (theta0 - theta_grid[j]) / (theta_grid[j + 1] - theta_grid[j])
+        corner = self.gains[i : i + 2, j : j + 2]
+        return (
+            (1 - t) * (1 - u) * corner[0, 0]
+            + t * (1 - u) * corner[1, 0]
+            + (1 - t) * u * corner[0, 1]
+            + t * u * corner[1, 1]
+        )
+
+    def predict(self, v0: float, theta0: float, state0, state_r):
+        """
+        unconstrained kappa rate sequence
+            input:
+                state0: initial state [nx]
+                state_r: reference states [horizon + 1, nx]
+            output:
+                U [horizon] or None outside the grid
+        """
+        gain = self.lookup(v0, theta0)
+        if gain is None:
+            return None
+        nx = self.nx
+        return gain[:, :nx] @ state0 + gain[:, nx:-1] @ state_r.ravel() + gain[:, -1]
+
+    def save(self, file_name: str):
+        np.savez(
+            file_name,
+            ts=self.ts,
+            horizon=self.horizon,
+            Q=self.Q,
+            QN=self.QN,
+            R=self.R,
+            v_grid=self.v_grid,
+            theta_grid=self.theta_grid,
+            gains=self.gains,
+        )
+
+    @classmethod
+    def load(cls, file_name: str):
+        with np.load(file_name) as data:
+            table = cls(
+                float(data["ts"]),
+                int(data["horizon"]),
+                data["Q"],
+                data["QN"],
+                float(data["R"]),
+                data["v_grid"],
+                data["theta_grid"],
+            )
+            table.gains = data["gains"]
+        return table
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+    from controller import ts, horizon
+    from referenceline import reference_line
+    from vehicle_model import vehicle_model
+
+    t0 = time.perf_counter()
+    table = mpc_gain_table.from_controller(LatKmMpc_Controller(ts, horizon))
+    print(f"build : {time.perf_counter() - t0:.2f} s, {table.gains.nbytes / 1e6:.1f} MB")
+    file_name = os.path.join(tempfile.gettempdir(), "lat_mpc_gain_table.npz")
+    table.save(file_name)
+    t0 = time.perf_counter()
+    table = mpc_gain_table.load(file_name)
+    print(f"load  : {(time.perf_counter() - t0) * 1e3:.1f} ms")
+
+    ### closed loop, table with QP fallback vs OSQP every step ###
+    ego = vehicle_model("ego", 0.0, 0.005, 10.0, 0.5, -5.0, -2.0)  # 3 m offset
+    ref_lin = reference_line(-5.0, 0.005, 0.0005)
+    explicit = LatKmMpc_Controller(ts, horizon, formulation="condensed", gain_table=table)
+    qp = LatKmMpc_Controller(ts, horizon, formulation="condensed")
+    t_explicit, t_qp, cmd_diff = [], [], []
+    for step in range(150):
+        nearest_point = ref_lin.get_nearest_point(ego.X, ego.Y, key=ego.name)
+        ds = ego.velocity * ts * np.arange(horizon)
+        control_ref = ref_lin.get_points_from_S(nearest_point, ds)
+        status = ego.get_vehicle_status()
+        t0 = time.perf_counter()
+        cmd = explicit.Update(status, control_ref)
+        t1 = time.perf_counter()
+        cmd_qp = qp.Update(status, control_ref)
+        t2 = time.perf_counter()
+        t_explicit.append(t1 - t0)
+        t_qp.append(t2 - t1)
+        cmd_diff.append(abs(cmd - cmd_qp))
+        ego.kinematic_Update(kappa_rate=cmd, acceleration=0.0, dt=ts)
+    print(explicit.get_gain_table_stats())
+    print(f"gain table : {np.mean(t_explicit[1:]) * 1e3:.3f} ms/step")
+    print(f"qp         : {np.mean(t_qp[1:]) * 1e3:.3f} ms/step")
+    print(f"max |cmd diff| : {max(cmd_diff):.2e}")
@@ -0,0 +1,257 @@
+import numpy as np
+from scipy.linalg import lapack
+
+
+class banded_ipm_solver:
+    """
+    Primal-dual interior point solver for the box constrained linear MPC
+
+        min  sum_k 0.5 x_k' Q x_k + q_k' x_k + 0.5 u_k' R u_k  (Q -> QN at k = N)
+        s.t. x_k+1 = A x_k + B u_k + w,   x_0 fixed,   u_min <= u_k <= u_max
+
+    The Hessian of every Newton step is block diagonal and the dynamics
+    Jacobian C is block bidiagonal, so the Schur complement Y = C H^-1 C' is
+    block tridiagonal and positive definite. Factorizing it is the same
+    stage by stage elimination as the Riccati recursion, done here as one
+    banded Cholesky (LAPACK pbtrf) of half bandwidth 2 nx - 1. Each Newton
+    step therefore costs O(horizon) with no per-stage Python loop.
+
+    Q and QN must be positive definite.
+    """
+
+    def __init__(
+        self,
+        horizon: int,
+        Q: np.ndarray,
+        QN: np.ndarray,
+        R: np.ndarray,
+        nx: int = 4,
+        nu: int = 1,
+    ):
+        self.horizon = horizon
+        self.nx = nx
+        self.nu = nu
+        self.R = np.atleast_2d(np.asarray(R, dtype=float))
+        # state Hessian of x_1 ... x_N and its inverse
+        self.Hx = np.empty((horizon, nx, nx))
+        self.Hx[:] = Q
+        self.Hx[-1] = QN
+        self.Hx_inv = np.linalg.inv(self.Hx)
+        self.max_iter = 50
+        self.tol = 1e-8  # relative
+        self.iterations = 0
+        # position of the Y blocks (upper triangle) in the band storage
+        self.kd = 2 * nx - 1
+        j = np.arange(horizon)[:, None]
+        a, b = np.triu_indices(nx)
+        self.diag_a, self.diag_b = a, b
+        self.diag_idx = (
+            np.broadcast_to(self.kd + a - b, (horizon, a.size)).ravel(),
+            (j * nx + b).ravel(),
+        )
+        a, b = np.indices((nx, nx)).reshape(2, -1)
+        self.off_a, self.off_b = a, b
+        self.off_idx = (
+            np.broadcast_to(self.kd + a - b - nx, (horizon - 1, a.size)).ravel(),
+            (j[:-1] * nx + nx + b).ravel(),
+        )
+        self.A = None
+        self.B = None
+        self.Y_band = None
+
+    def set_model(self, A: np.ndarray, B: np.ndarray):
+        """
+        assemble the input independent part of Y for a new (A, B)
+        """
+        N = self.horizon
+        self.A = np.asarray(A, dtype=float)
+        self.B = np.asarray(B, dtype=float)
+        # Y_jj = A Hx_j^-1 A' (j >= 1) + B Hu_j^-1 B' + Hx_j+1^-1
+        Y_diag = self.Hx_inv.copy()
+        Y_diag[1:] += self.A @ self.Hx_inv[:-1] @ self.A.T
+        # Y_j,j+1 = -Hx_j+1^-1 A'
+        Y_off = -self.Hx_inv[:-1] @ self.A.T
+        self.Y_band = np.zeros((self.kd + 1, N * self.nx))
+        self.Y_band[self.diag_idx] = Y_diag[:, self.diag_a, self.diag_b].ravel()
+        self.Y_band[self.off_idx] = Y_off[:, self.off_a, self.off_b].ravel()
+
+    def factor(self, Hu_inv: np.ndarray):
+        """
+        Cholesky factor of Y for the input Hessian inverse Hu_inv [N, nu, nu]
+        """
+        BHB = self.B @ Hu_inv @ self.B.T
+        Y_band = self.Y_band.copy()
+        Y_band[self.diag_idx] += BHB[:, self.diag_a, self.diag_b].ravel()
+        chol, info = lapack.dpbtrf(Y_band)
+        if info != 0:
+            raise np.linalg.LinAlgError("Schur complement is not positive definite")
+        return chol
+
+    def kkt_step(self, chol, Hu_inv, g_u, g_x, r_dyn):
+        """
+        solve [H C'; C 0] [dz; dlam] = -[g; r_dyn]
+            output:
+                dU [N, nu], dX [N, nx] (x_1 ... x_N), dLam [N, nx]
+        """
+        A, B = self.A, self.B
+        # v = H^-1 g
+        v_u = np.einsum("kij,kj->ki", Hu_inv, g_u)
+        v_x = np.einsum("kij,kj->ki", self.Hx_inv, g_x)
+        # Y dlam = r_dyn - C v
+        rhs = r_dyn - v_u @ B.T + v_x
+        rhs[1:] -= v_x[:-1] @ A.T
+        dLam, _ = lapack.dpbtrs(chol, rhs.reshape(-1, 1))
+        dLam = dLam.reshape(rhs.shape)
+        # dz = -H^-1 (g + C' dlam)
+        dU = -np.einsum("kij,kj->ki", Hu_inv, g_u + dLam @ B)
+        ct_x = -dLam
+        ct_x[:-1] += dLam[1:] @ A
+        dX = -np.einsum("kij,kj->ki", self.Hx_inv, g_x + ct_x)
+        return dU, dX, dLam
+
+    def residual(self, x0, w, q, U, X, Lam):
+        """
+        KKT residuals of stationarity in u, x and of the dynamics
+        """
+        A, B = self.A, self.B
+        r_u = U @ self.R.T + Lam @ B  # R u_k + B' lambda_k+1
+        r_x = np.einsum("kij,kj->ki", self.Hx, X[1:]) + q[1:]
+        r_x -= Lam
+        r_x[:-1] += Lam[1:] @ A  # A' lambda_k+2
+        X_prev = np.vstack([x0, X[1:-1]])
+        r_dyn = X_prev @ A.T + U @ B.T + w - X[1:]
+        return r_u, r_x, r_dyn
+
+    def solve(self, x0, w, q, u_min, u_max):
+        """
+        input:
+            x0: fixed initial state [nx]
+            w: constant drift term of the dynamics [nx]
+            q: linear state cost per stage [horizon + 1, nx]
+            u_min, u_max: input box
+        output:
+            U [horizon, nu], X [horizon + 1, nx]
+        """
+        nx, nu, N = self.nx, self.nu, self.horizon
+        B = self.B
+        u_min = np.broadcast_to(u_min, (N, nu))
+        u_max = np.broadcast_to(u_max, (N, nu))
+        # unconstrained optimum, pulled into the box
+        X = np.zeros((N + 1, nx))
+        X[0] = x0
+        U = np.zeros((N, nu))
+        Lam = np.zeros((N, nx))
+        R_inv = np.broadcast_to(np.linalg.inv(self.R), (N, nu, nu))
+        r_u, r_x, r_dyn = self.residual(x0, w, q, U, X, Lam)
+        dU, _, _ = self.kkt_step(self.factor(R_inv), R_inv, r_u, r_x, r_dyn)
+        margin = 0.1 * (u_max - u_min)
+        U = np.clip(dU, u_min + margin, u_max - margin)
+        # states and multipliers consistent with the pinned inputs, Hu^-1 = 0
+        pinned = np.zeros((N, nu, nu))
+        r_u, r_x, r_dyn = self.residual(x0, w, q, U, X, Lam)
+        _, dX, dLam = self.kkt_step(self.factor(pinned), pinned, r_u, r_x, r_dyn)
+        X[1:] += dX
+        Lam += dLam
+        s1 = u_max - U  # slack of u <= u_max
+        s2 = U - u_min  # slack of u >= u_min
+        g = U @ self.R.T + Lam @ B
+        z1 = np.maximum(-g, 0.0) + 1.0  # multiplier of u <= u_max
+        z2 = np.maximum(g, 0.0) + 1.0  # multiplier of u >= u_min
+        n_ineq = 2 * N * nu
+        u_range = np.max(u_max - u_min)
+        q_scale = 1.0 + np.max(np.abs(q))
+        eye_u = np.eye(nu)
+        for it in range(self.max_iter):
+            gap = (np.sum(s1 * z1) + np.sum(s2 * z2)) / n_ineq
+            r_u, r_x, r_dyn = self.residual(x0, w, q, U, X, Lam)
+            z_scale = 1.0 + max(np.max(z1), np.max(z2))
+            if (
+                gap < self.tol * z_scale * u_range
+                and np.max(np.abs(r_u + z1 - z2)) < self.tol * z_scale
+                and np.max(np.abs(r_x)) < self.tol * q_scale
+                and np.max(np.abs(r_dyn)) < self.tol * (1.0 + np.max(np.abs(X)))
+            ):
+                break
+            # only the input Hessian depends on the iterate
+            sigma_u = (z1 / s1 + z2 / s2)[:, :, None] * eye_u
+            Hu_inv = np.linalg.inv(self.R + sigma_u)
+            chol = self.factor(Hu_inv)
+
+            def newton(t1, t2):
+                g_u = r_u + t1 / s1 - t2 / s2
+                dU, dX, dLam = self.kkt_step(chol, Hu_inv, g_u, r_x, r_dyn)
+                dz1 = t1 / s1 - z1 + z1 / s1 * dU
+                dz2 = t2 / s2 - z2 - z2 / s2 * dU
+                return dU, dX, dLam, dz1, dz2
+
+            # predictor (affine scaling) step
+            dU, dX, dLam, dz1, dz2 = newton(0.0, 0.0)
+            alpha = self.step_length(s1, s2, z1, z2, dU, dz1, dz2)
+            gap_aff = (
+                np.sum((s1 - alpha * dU) * (z1 + alpha * dz1))
+                + np.sum((s2 + alpha * dU) * (z2 + alpha * dz2))
+            ) / n_ineq
+            sigma = (gap_aff / gap) ** 3
+            # corrector step
+            t1 = sigma * gap + dU * dz1  # - d_s1 * d_z1, d_s1 = -dU
+            t2 = sigma * gap - dU * dz2
+            dU, dX, dLam, dz1, dz2 = newton(t1, t2)
+            alpha = 0.995 * self.step_length(s1, s2, z1, z2, dU, dz1, dz2)
+            U = U + alpha * dU
+            s1 = s1 - alpha * dU
+            s2 = s2 + alpha * dU
+            X[1:] += alpha * dX
+            Lam += alpha * dLam
+            z1 = z1 + alpha * dz1
+            z2 = z2 + alpha * dz2
+        self.iterations = it + 1
+        return U, X
+
+    @staticmethod
+    def step_length(s1, s2, z1, z2, dU, dz1, dz2) -> float:
+        """
+        largest step in (0, 1] that keeps slacks and multipliers positive
+        """
+        value = np.hstack([s1, s2, z1, z2])
+        delta = np.hstack([-dU, dU, dz1, dz2])
+        mask = delta < 0.0
+        if not mask.any():
+            return 1.0
+        return min(1.0, np.min(-value[mask] / delta[mask]))
+
+
+if __name__ == "__main__":
+    import time
+    from controller import LatKmMpc_Controller, ts
+    from referenceline import reference_line
+    from vehicle_model import vehicle_model
+
+    ### solve time against horizon length, OSQP vs banded ###
+    ego = vehicle_model("ego", 0.0, 0.005, 10.0, 0.5, -5.0, -5.0)
+    ref_lin = reference_line(-5.0, 0.005, 0.0005)
+    ref_lin.points = ref_lin.get_ref_points(1000.0)
+    nearest_point = ref_lin.get_nearest_point(ego.X, ego.Y)
+    status = ego.get_vehicle_status()
+    backends = {
+        "osqp rebuild": {},
+        "osqp persistent": {"persistent": True},
+        "banded": {"solver": "banded"},
+    }
+    repeat = 20
+    print("horizon " + "".join(f"{key:>18}" for key in backends) + "   [ms/solve]")
+    for horizon in (10, 25, 50, 100, 200, 400):
+        ds = ego.velocity * ts * np.arange(horizon)
+        control_ref = ref_lin.get_points_from_S(nearest_point, ds)
+        row, cmd = [], []
+        for kwargs in backends.values():
+            mpc = LatKmMpc_Controller(ts, horizon, **kwargs)
+            mpc.Update(status, control_ref)  # set up workspaces
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                cmd.append(mpc.Update(status, control_ref))
+            row.append((time.perf_counter() - t0) / repeat * 1e3)
+        print(
+            f"{horizon:>7} "
+            + "".join(f"{t:>18.3f}" for t in row)
+            + f"   max |cmd diff| {np.ptp(cmd):.1e}"
+        )
@@ -1,8 +1,9 @@
+import bisect
+import heapq
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 from referenceline import reference_line, Point
-from vehicle_model import vehicle_model
+from vehicle_model import vehicle_model, get_corner_points
 from math import *
 from typing import List
 from utilities import *
@@ -11,56 +12,183 @@ road_type = {"yellow line": 0, "white line": 1, "road edge": 2, "fence": 3}
 
 
 class line_geometry:
-    def __init__(self):
-        self.x0 = 0.0
-        self.C0 = 0.0
-        self.C1 = 0.0
-        self.C2 = 0.0
-        self.type: int = 1
+    """
+    lane marking in the ego frame, y = C0 + C1 * x + C2 * x^2 for x >= x0
+    """
+
+    def __init__(self, C0: float = 0.0, C1: float = 0.0, C2: float = 0.0, x0: float = 0.0, type: int = 1):
+        self.x0 = x0
+        self.C0 = C0
+        self.C1 = C1
+        self.C2 = C2
+        self.type: int = type
 
 
 class bev_road_sensor:
-    def __init__(self, name: str):
+    """
+    Fits the detectable reference lines around the sensor as lane markings.
+
+    The points of all lines are kept end to end in one table, s shifted so
+    it keeps increasing across lines. Every Update projects the sensor onto
+    all lines at once (windowed around the last match of every line, like
+    nearest_point_projector), samples a lookahead window of n_samples
+    points of every line with one searchsorted, transforms the samples into
+    the sensor frame and least squares fits C0..C2 of all lines in one
+    batched 3x3 solve. left / leftleft are the nearest lines with C0 > 0,
+    right / rightright the nearest with C0 < 0, None where there is none.
+    A line with less than min_length left ahead of the sensor is not seen.
+    """
+
+    def __init__(self, name: str, lookahead: float = 50.0, n_samples: int = 16, min_length: float = 5.0):
         self.name = name
         self.position = None
+        self.lookahead = lookahead
+        self.n_samples = n_samples
+        self.min_length = min_length
+        self.window = 10
+        self.max_slides = 4
+        self.lines: List[line_geometry] = []
         self.leftleft: line_geometry = None
         self.left: line_geometry = None
         self.right: line_geometry = None
         self.rightright: line_geometry = None
+        ## lines end to end, rebuilt when a line changes ##
+        self.line_points = None  # PointBatch of every line
+        self.points_x = None
+        self.points_y = None
+        self.points_s = None  # s + base of the line
+        self.base = None  # [lines]
+        self.first = None  # [lines], index of the first point of the line
+        self.last = None  # [lines], index of the last point of the line
+        self.last_index = None  # [lines], last nearest sample, None before the first search
 
-    def Update(self, sensor_loc: vehicle_model, ref_line: list[reference_line]) -> None:
+    def set_lines(self, ref_lines: list[reference_line]):
+        line_points = [item.get_point_arrays() for item in ref_lines]
+        if self.line_points is not None and len(line_points) == len(self.line_points) and all(
+            a is b for a, b in zip(line_points, self.line_points)
+        ):
+            return
+        n_points = np.array([len(points) for points in line_points])
+        s_end = np.array([points.s[-1] for points in line_points])
+        self.line_points = line_points
+        self.points_x = np.concatenate([points.x for points in line_points])
+        self.points_y = np.concatenate([points.y for points in line_points])
+        self.base = np.concatenate([[0.0], np.cumsum(s_end + 1.0)[:-1]])
+        self.points_s = np.concatenate([points.s + b for points, b in zip(line_points, self.base)])
+        self.last = np.cumsum(n_points) - 1
+        self.first = self.last - n_points + 1
+        self.last_index = None
+
+    def nearest_index(self, x: float, y: float) -> np.ndarray:
+        """
+        index of the nearest sample of every line, windowed around the last
+        match, sliding while the match is on the window border
+        """
+        i = self.last_index
+        offsets = np.arange(-self.window, self.window + 1)
+        for _ in range(self.max_slides + 1 if i is not None else 0):
+            candidates = np.minimum(np.maximum(i[:, None] + offsets, self.first[:, None]), self.last[:, None])
+            dist2 = (self.points_x[candidates] - x) ** 2 + (self.points_y[candidates] - y) ** 2
+            i = candidates[np.arange(i.size), np.argmin(dist2, axis=1)]
+            lo = candidates[:, 0]
+            hi = candidates[:, -1]
+            on_border = ((i == lo) & (lo > self.first)) | ((i == hi) & (hi < self.last))
+            if not on_border.any():
+                break
+        else:
+            # first search or a jump: every line, every point
+            dist2 = (self.points_x - x) ** 2 + (self.points_y - y) ** 2
+            line_id = np.repeat(np.arange(self.first.size), self.last - self.first + 1)
+            order = np.lexsort((dist2, line_id))
+            i = order[self.first]
+        self.last_index = i
+        return i
+
+    def project_S(self, x: float, y: float) -> np.ndarray:
+        """
+        shifted s of the foot point on the segments next to the nearest
+        sample of every line
+        """
+        i = self.nearest_index(x, y)
+        best_s = self.points_s[i]
+        best_dist2 = (self.points_x[i] - x) ** 2 + (self.points_y[i] - y) ** 2
+        for a in (np.maximum(i - 1, self.first), np.minimum(i, self.last - 1)):
+            px, py, ps = self.points_x[a], self.points_y[a], self.points_s[a]
+            ex, ey = self.points_x[a + 1] - px, self.points_y[a + 1] - py
+            t = ((x - px) * ex + (y - py) * ey) / np.maximum(ex * ex + ey * ey, 1e-12)
+            t = np.minimum(np.maximum(t, 0.0), 1.0)
+            dist2 = (px + t * ex - x) ** 2 + (py + t * ey - y) ** 2
+            closer = dist2 < best_dist2
+            best_s = np.where(closer, ps + t * (self.points_s[a + 1] - ps), best_s)
+            best_dist2 = np.minimum(dist2, best_dist2)
+        return best_s
+
+    def fit_lines(self, sensor_loc: vehicle_model, ref_lines: list[reference_line]) -> np.ndarray:
+        """
+        polynomial of every line in the sensor frame
+            output:
+                coefficients [lines, 3], C0, C1, C2, nan for lines not seen
+        """
         global_x = sensor_loc.X
         global_y = sensor_loc.Y
         global_angle = sensor_loc.angle
-        global_s = sensor_loc.s
-        all_ref_left = []
-        all_ref_right = []
-        for item in ref_line:
-            if item.detectable == False: # if not detectable skip
-                continue
-            nearest_point = item.get_nearest_point(global_x, global_y)
-            kappa = nearest_point.kappa
-            x_n, y_n, angle_n = Coordinate_transform(
-                nearest_point.x,
-                nearest_point.y,
-                nearest_point.angle,
-                global_x,
-                global_y,
-                global_angle,
-            )
-            if y_n > 0.0:
-                all_ref_left.append(line_geometry(x_n, y_n, angle_n, kappa))
-            else:
-                all_ref_right.append(line_geometry(x_n, y_n, angle_n, kappa))
-        # sort line by y
-            all_ref_left = sorted(all_ref_left, key=lambda x: x.C0, reverse=True)
-            all_ref_right = sorted(all_ref_right, key=lambda x: x.C0)
-            self.left = all_ref_left.pop(0)
-            self.leftleft = all_ref_left.pop(0)
-            self.right = all_ref_right.pop(0)
-            self.rightright = all_ref_right.pop(0)
+        self.set_lines(ref_lines)
+        s0 = self.project_S(global_x, global_y)
+        # lookahead window of every line, clipped to the line
+        ds = np.linspace(0.0, self.lookahead, self.n_samples)
+        s_end = self.points_s[self.last]
+        visible = s_end - s0 >= self.min_length
+        s = np.minimum(s0[:, None] + ds, s_end[:, None])
+        i = np.searchsorted(self.points_s, s, side="right")
+        i = np.minimum(np.maximum(i, self.first[:, None] + 1), self.last[:, None])
+        t = (s - self.points_s[i - 1]) / (self.points_s[i] - self.points_s[i - 1])
+        dx = self.points_x[i - 1] + t * (self.points_x[i] - self.points_x[i - 1]) - global_x
+        dy = self.points_y[i - 1] + t * (self.points_y[i] - self.points_y[i - 1]) - global_y
+        # into the sensor frame
+        cos_a = cos(global_angle)
+        sin_a = sin(global_angle)
+        x_n = cos_a * dx + sin_a * dy
+        y_n = -sin_a * dx + cos_a * dy
+        # normal equations of y = c0 + c1 u + c2 u^2, u = x / lookahead for conditioning
+        u = x_n / self.lookahead
+        powers = u[:, :, None] ** np.arange(5)  # [lines, samples, 5]
+        moments = powers.sum(axis=1)
+        G = moments[:, np.array([[0, 1, 2], [1, 2, 3], [2, 3, 4]])]
+        b = np.einsum("lsk,ls->lk", powers[:, :, :3], y_n)
+        coefficients = np.full((s0.size, 3), np.nan)
+        if visible.any():
+            coefficients[visible] = np.linalg.solve(G[visible], b[visible, :, None])[:, :, 0]
+        return coefficients / self.lookahead ** np.arange(3)
+
+    def Update(self, sensor_loc: vehicle_model, ref_line: list[reference_line]) -> None:
+        detectable = [item for item in ref_line if item.detectable]
+        self.lines = []
+        self.leftleft = self.left = self.right = self.rightright = None
+        if len(detectable) == 0:
+            return
+        coefficients = self.fit_lines(sensor_loc, detectable)
+        coefficients = coefficients[~np.isnan(coefficients[:, 0])]
+        self.lines = [line_geometry(C0, C1, C2) for C0, C1, C2 in coefficients.tolist()]
+        # one partition by C0: [..., rightright, right | left, leftleft, ...]
+        order = np.argsort(coefficients[:, 0], kind="stable")
+        split = int(np.searchsorted(coefficients[order, 0], 0.0, side="right"))
+        slots = {"rightright": split - 2, "right": split - 1, "left": split, "leftleft": split + 1}
+        for name, k in slots.items():
+            if 0 <= k < len(order):
+                setattr(self, name, self.lines[order[k]])
+
 
 class object:
+    """
+    Target driving along ref_line at constant velocity, offset [m] to the
+    left of the line.
+
+    The object keeps a cursor on the reference line: segment i with
+    points[i].s <= s < points[i + 1].s. Update only walks the cursor over
+    the segments passed since the last step, O(1) amortized however long
+    the line is. The pose loc is interpolated and offset when it is read.
+    """
+
     def __init__(
         self,
         name: str,
@@ -74,18 +202,51 @@ class object:
         self.Width = Width
         self.Length = Length
         self.name = name
-        self.s = s0
         self.velocity = velocity
         self.ref_l = ref_line
         self.offset = offset
-        self.loc = self.ref_l.get_point_from_S(self.ref_l.points[0], self.s)
+        self.set_s(s0)
+
+    def set_s(self, s: float):
+        """
+        place the object at s, searching the cursor again
+        """
+        self.ref_points = self.ref_l.get_point_arrays()
+        self.ref_columns = self.ref_l.get_point_columns()
+        s_points = self.ref_columns[6]
+        self.s = s
+        # same segment as reference_line.interpolate_S, extrapolated past the ends
+        i = int(np.searchsorted(s_points, s, side="right")) - 1
+        self.segment = min(max(i, 0), len(s_points) - 2)
+        self._loc = None
 
     def Update(self, ts: float):
-        ds = self.velocity * ts
-        self.s += ds
-        self.loc = self.ref_l.get_point_from_S(self.loc, ds)
-        self.loc.x -= self.offset * cos(self.loc.angle)
-        self.loc.y += self.offset * sin(self.loc.angle)
+        if self.ref_l.get_point_arrays() is not self.ref_points:
+            self.set_s(self.s)  # points of the reference line were replaced
+        self.s += self.velocity * ts
+        s_points = self.ref_columns[6]
+        i = self.segment
+        while i < len(s_points) - 2 and s_points[i + 1] <= self.s:
+            i += 1
+        while i > 0 and s_points[i] > self.s:
+            i -= 1
+        self.segment = i
+        self._loc = None
+
+    @property
+    def loc(self) -> Point:
+        """
+        pose at s, offset to the left of the reference line
+        """
+        if self._loc is None:
+            i = self.segment
+            s_points = self.ref_columns[6]
+            t = (self.s - s_points[i]) / (s_points[i + 1] - s_points[i])
+            loc = Point(*[column[i] + t * (column[i + 1] - column[i]) for column in self.ref_columns])
+            loc.x -= self.offset * sin(loc.angle)
+            loc.y += self.offset * cos(loc.angle)
+            self._loc = loc
+        return self._loc
 
     def position(self):
         """
@@ -123,6 +284,8 @@ class object:
             raise RuntimeError(f"Error calculating vehicle position: {str(e)}")
 
     def show_object(self, ax):
+        import matplotlib.patches as patches  # plotting only, keeps headless use free of matplotlib
+
         loc = self.position()
         rect = patches.Polygon(
             loc, linewidth=2, edgecolor="red", facecolor="red", alpha=0.7
@@ -131,15 +294,48 @@ class object:
 
 
 class detect_sensor:
-    def __init__(self, ego_vehicle: vehicle_model):
+    """
+    Objects around the ego vehicle, with indexes for the queries a planner
+    asks every cycle:
+        objects_by_name: name -> object, first registered wins
+        grid: uniform grid of cell_size [m] over object locations,
+              cell -> set of object indices, for range and k nearest queries
+        lanes: (ref_line, lane) -> objects sorted by s, lane is the object
+               offset in lane_width units, for lead vehicle queries
+    Update(ts) moves an object to another grid cell only when it crosses a
+    cell border and re-sorts the lanes, which are nearly sorted already.
+    """
+
+    def __init__(self, ego_vehicle: vehicle_model, cell_size: float = 20.0, lane_width: float = 3.5):
         self.Object_list: List[object] = []
         self.ref_line_list: List[reference_line] = []
 
         self.bev_objects = []
         self.ego_ = ego_vehicle
         self.bev_road = bev_road_sensor("bev_road")
+        ## object indexes ##
+        self.cell_size = cell_size
+        self.lane_width = lane_width
+        self.objects_by_name = {}
+        self.grid = {}
+        self.cells = []
+        # bounding box of the occupied cells, limits k nearest search,
+        # None when a cell on it was emptied, see get_grid_bounds
+        self.grid_bounds = None
+        self.lanes = {}
+        self.lane_s = {}
+
     def register_object(self, target: object):
         self.Object_list.append(target)
+        self.objects_by_name.setdefault(target.name, target)
+        cell = self.get_cell(target.loc.x, target.loc.y)
+        self.cells.append(cell)
+        self.add_to_cell(cell, len(self.Object_list) - 1)
+        key = (target.ref_l, self.get_lane(target.offset))
+        members = self.lanes.setdefault(key, [])
+        members.append(target)
+        members.sort(key=lambda x: x.s)
+        self.lane_s[key] = [member.s for member in members]
         return True
     def register_ref_line(self, ref_line: reference_line):
         self.ref_line_list.append(ref_line)
@@ -148,22 +344,373 @@ class detect_sensor:
         # update objects
         if len(self.Object_list) > 0:
             for i in range(len(self.Object_list)):
-                self.Object_list[i].Update(ts)
+                target = self.Object_list[i]
+                target.Update(ts)
+                cell = self.get_cell(target.loc.x, target.loc.y)
+                if cell != self.cells[i]:
+                    self.remove_from_cell(self.cells[i], i)
+                    self.add_to_cell(cell, i)
+                    self.cells[i] = cell
+            for key, members in self.lanes.items():
+                members.sort(key=lambda x: x.s)
+                self.lane_s[key] = [member.s for member in members]
         # update bev_road sensor
         if len(self.ref_line_list) > 0:
             self.bev_road.Update(self.ego_, self.ref_line_list)
 
     def get_object_by_name(self, name: str) -> object:
-        return next(
-            (Object for Object in self.Object_list if Object.name == name), None
-        )
+        return self.objects_by_name.get(name)
+
+    def get_cell(self, x: float, y: float):
+        return (floor(x / self.cell_size), floor(y / self.cell_size))
+
+    def get_lane(self, offset: float) -> int:
+        return round(offset / self.lane_width)
+
+    def add_to_cell(self, cell, index: int):
+        self.grid.setdefault(cell, set()).add(index)
+        bounds = self.grid_bounds
+        if bounds is not None:
+            bounds[0] = min(bounds[0], cell[0])
+            bounds[1] = min(bounds[1], cell[1])
+            bounds[2] = max(bounds[2], cell[0])
+            bounds[3] = max(bounds[3], cell[1])
+
+    def remove_from_cell(self, cell, index: int):
+        """
+        an emptied cell leaves the grid, so the grid only holds occupied cells
+        """
+        indices = self.grid[cell]
+        indices.discard(index)
+        if not indices:
+            del self.grid[cell]
+            bounds = self.grid_bounds
+            # a cell on the bounding box may have been the last one there
+            if bounds is not None and (cell[0] in (bounds[0], bounds[2]) or cell[1] in (bounds[1], bounds[3])):
+                self.grid_bounds = None
+
+    def get_grid_bounds(self):
+        """
+        [i_min, j_min, i_max, j_max] of the occupied cells, None without objects
+        """
+        if self.grid_bounds is None and self.grid:
+            i_cells = [i for i, _ in self.grid]
+            j_cells = [j for _, j in self.grid]
+            self.grid_bounds = [min(i_cells), min(j_cells), max(i_cells), max(j_cells)]
+        return self.grid_bounds
+
+    def get_objects_in_range(self, x: float, y: float, radius: float) -> List[object]:
+        """
+        objects with location within radius of (x, y)
+            input:
+                x, y: query point in global coordinate
+                radius: search radius [m]
+            output:
+                objects sorted by distance
+        """
+        i_min, j_min = self.get_cell(x - radius, y - radius)
+        i_max, j_max = self.get_cell(x + radius, y + radius)
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > len(self.grid):
+            # radius covers more cells than are occupied
+            cells = [
+                indices
+                for (i, j), indices in self.grid.items()
+                if i_min <= i <= i_max and j_min <= j <= j_max
+            ]
+        else:
+            cells = [
+                self.grid[(i, j)]
+                for i in range(i_min, i_max + 1)
+                for j in range(j_min, j_max + 1)
+                if (i, j) in self.grid
+            ]
+        found = []
+        for indices in cells:
+            for index in indices:
+                loc = self.Object_list[index].loc
+                distance = hypot(loc.x - x, loc.y - y)
+                if distance <= radius:
+                    found.append((distance, index))
+        found.sort()
+        return [self.Object_list[index] for _, index in found]
+
+    def get_k_nearest_objects(self, x: float, y: float, k: int = 1) -> List[object]:
+        """
+        k objects nearest to (x, y), searched ring by ring of grid cells
+        around the cell of the query point, or over the occupied cells once
+        a ring would hold more cells than are occupied
+            input:
+                x, y: query point in global coordinate
+                k: number of objects
+            output:
+                objects sorted by distance, fewer than k if fewer registered
+        """
+        bounds = self.get_grid_bounds()
+        if k <= 0 or bounds is None:
+            return []
+        ci, cj = self.get_cell(x, y)
+        i_min, j_min, i_max, j_max = bounds
+        # beyond this ring there are no cells left
+        max_ring = max(ci - i_min, i_max - ci, cj - j_min, j_max - cj, 0)
+        found = []
+        visited = 0
+        for ring in range(max_ring + 1):
+            if visited + 8 * ring > len(self.grid):
+                # the next ring has more cells than are occupied, scan those instead
+                found = [
+                    (hypot(loc.x - x, loc.y - y), index)
+                    for indices in self.grid.values()
+                    for index in indices
+                    for loc in (self.Object_list[index].loc,)
+                ]
+                break
+            if ring == 0:
+                cells = [(ci, cj)]
+            else:
+                cells = [(ci + d, cj - ring) for d in range(-ring, ring + 1)]
+                cells += [(ci + d, cj + ring) for d in range(-ring, ring + 1)]
+                cells += [(ci - ring, cj + d) for d in range(-ring + 1, ring)]
+                cells += [(ci + ring, cj + d) for d in range(-ring + 1, ring)]
+            visited += len(cells)
+            for cell in cells:
+                for index in self.grid.get(cell, ()):
+                    loc = self.Object_list[index].loc
+                    found.append((hypot(loc.x - x, loc.y - y), index))
+            if len(found) == len(self.Object_list):
+                break
+            # objects outside the searched rings are at least ring * cell_size away
+            if len(found) >= k and heapq.nsmallest(k, found)[-1][0] <= ring * self.cell_size:
+                break
+        return [self.Object_list[index] for _, index in heapq.nsmallest(k, found)]
+
+    def get_lead_object(self, ref_line: reference_line, s: float = None, offset: float = 0.0) -> object:
+        """
+        nearest object ahead on the same lane of ref_line
+            input:
+                ref_line: reference line the objects drive along
+                s: arc length of the query position, ego s by default
+                offset: lateral offset of the query position
+            output:
+                object with the smallest s > s on the lane, None if there is none
+        """
+        if s is None:
+            s = self.ego_.s
+        key = (ref_line, self.get_lane(offset))
+        lane_s = self.lane_s.get(key)
+        if not lane_s:
+            return None
+        index = bisect.bisect_right(lane_s, s)
+        if index == len(lane_s):
+            return None
+        return self.lanes[key][index]
+
+    def get_object_positions(self) -> np.ndarray:
+        """
+        corner points of every registered object
+            output:
+                points [N, 4, 2], same order as object.position
+        """
+        state = np.array(
+            [
+                (target.loc.x, target.loc.y, target.loc.angle, target.Width, target.Length)
+                for target in self.Object_list
+            ]
+        ).reshape(-1, 5)
+        return get_corner_points(*state.T)
 
     def plot_targets(self, ax):
         for i in range(len(self.Object_list)):
             loc_target = self.Object_list[i].show_object(ax)
 
 
-if __name__ == "__main__":
+def benchmark_queries():
+    """
+    indexed queries against linear scans over the registered objects
+    """
+    import time
+    from referenceline import straight_road, left_curve_road, right_curve_road
+
+    def best_time(function, number):
+        t_best = np.inf
+        for _ in range(5):
+            t0 = time.perf_counter()
+            for _ in range(number):
+                function()
+            t_best = min(t_best, (time.perf_counter() - t0) / number)
+        return t_best
+
+    rng = np.random.default_rng(0)
+    roads = [straight_road, left_curve_road, right_curve_road]
+    ego = vehicle_model("ego", 0.01, 0.002, 15.0, -4, 0, 40)
+    print(f"{'objects':>7} {'query':<14} {'linear [us]':>12} {'indexed [us]':>13}")
+    for n_objects in (100, 1000, 5000):
+        sensor = detect_sensor(ego)
+        for i in range(n_objects):
+            road = roads[i % len(roads)]
+            sensor.register_object(
+                object(
+                    f"car{i}",
+                    1.9,
+                    5.0,
+                    rng.uniform(0.0, 150.0),
+                    rng.uniform(5.0, 30.0),
+                    road,
+                    sensor.lane_width * rng.integers(-1, 2),
+                )
+            )
+        for _ in range(5):
+            sensor.Update(0.1)
+        targets = sensor.Object_list
+        x, y, s = 60.0, 10.0, 60.0
+
+        def linear_name():
+            return next((Object for Object in targets if Object.name == f"car{n_objects - 1}"), None)
+
+        def linear_range():
+            found = [(hypot(t.loc.x - x, t.loc.y - y), i) for i, t in enumerate(targets)]
+            return [targets[i] for d, i in sorted(found) if d <= 10.0]
+
+        def linear_nearest():
+            found = [(hypot(t.loc.x - x, t.loc.y - y), i) for i, t in enumerate(targets)]
+            return [targets[i] for _, i in sorted(found)[:5]]
+
+        def linear_lead():
+            ahead = [t for t in targets if t.ref_l is straight_road and t.s > s and sensor.get_lane(t.offset) == 0]
+            return min(ahead, key=lambda t: t.s, default=None)
+
+        queries = [
+            ("by name", linear_name, lambda: sensor.get_object_by_name(f"car{n_objects - 1}")),
+            ("range 10 m", linear_range, lambda: sensor.get_objects_in_range(x, y, 10.0)),
+            ("5 nearest", linear_nearest, lambda: sensor.get_k_nearest_objects(x, y, 5)),
+            ("lead vehicle", linear_lead, lambda: sensor.get_lead_object(straight_road, s)),
+        ]
+        for name, linear, indexed in queries:
+            assert linear() == indexed(), name
+            t_linear = best_time(linear, 20)
+            t_indexed = best_time(indexed, 200)
+            print(f"{n_objects:>7} {name:<14} {t_linear * 1e6:>12.1f} {t_indexed * 1e6:>13.1f}")
+
+
+def check_long_run():
+    """
+    objects driving far along a long line: the grid keeps only occupied cells
+    and k nearest queries stay as cheap as at the start
+    """
+    import time
+
+    line = reference_line(10.0, 0.0, 0.0)
+    line.points = line.get_ref_points(200000.0, 20000)
+    ego = vehicle_model("ego", 0.01, 0.002, 15.0, -4, 0, 40)
+    sensor = detect_sensor(ego)
+    for i in range(3):
+        sensor.register_object(object(f"car{i}", 1.9, 5.0, 10.0 * i, 30.0, line))
+    t0 = time.perf_counter()
+    sensor.get_k_nearest_objects(0.0, 10.0, 5)
+    t_start = time.perf_counter() - t0
+    for _ in range(20000):
+        sensor.Update(0.1)
+    assert len(sensor.grid) <= len(sensor.Object_list)
+    i_min, j_min, i_max, j_max = sensor.get_grid_bounds()
+    assert {i for i, _ in sensor.grid} >= {i_min, i_max}
+    t0 = time.perf_counter()
+    nearest = sensor.get_k_nearest_objects(0.0, 10.0, 5)
+    t_end = time.perf_counter() - t0
+    assert nearest == sorted(sensor.Object_list, key=lambda t: hypot(t.loc.x, t.loc.y - 10.0))
+    print(
+        f"after 20000 steps: {len(sensor.grid)} cells, 5 nearest "
+        f"{t_start * 1e6:.1f} us at the start, {t_end * 1e6:.1f} us now"
+    )
+
+
+def benchmark_bev_road():
+    """
+    batched lane fitting against fitting one line at a time
+    """
+    import time
+    from referenceline import mid
+
+    def fit_line_by_line(sensor: bev_road_sensor, ego: vehicle_model, ref_lines: list[reference_line]):
+        lines = []
+        ds = np.linspace(0.0, sensor.lookahead, sensor.n_samples)
+        for item in ref_lines:
+            nearest_point = item.get_nearest_point(ego.X, ego.Y, key="line by line")
+            points = item.get_points_from_S(nearest_point, ds)
+            dx = points.x - ego.X
+            dy = points.y - ego.Y
+            x_n = cos(ego.angle) * dx + sin(ego.angle) * dy
+            y_n = -sin(ego.angle) * dx + cos(ego.angle) * dy
+            lines.append(np.polyfit(x_n, y_n, 2)[::-1])
+        return np.array(lines)
+
+    ego = vehicle_model("ego", 0.01, 0.002, 15.0, -4, 0, 40)
+    ego.X, ego.Y, ego.angle = 20.0, mid + 0.5, 0.05
+    print(f"{'lines':>7} {'line by line [us]':>18} {'batched [us]':>13}")
+    for n_lines in (1, 4, 16, 64, 256):
+        ref_lines = []
+        for k in range(n_lines):
+            item = reference_line(mid + 3.5 * (k - n_lines // 2) + 1.75, 0.01 * k, 1e-4 * k)
+            item.detectable = True
+            ref_lines.append(item)
+        sensor = bev_road_sensor("bev_road")
+        sensor.Update(ego, ref_lines)
+        expected = fit_line_by_line(sensor, ego, ref_lines)
+        assert np.allclose(sensor.fit_lines(ego, ref_lines), expected, atol=1e-6)
+        if n_lines >= 4:
+            C0 = [line.C0 for line in (sensor.rightright, sensor.right, sensor.left, sensor.leftleft)]
+            assert C0[0] < C0[1] < 0.0 < C0[2] < C0[3]
+        timings = []
+        for update in (lambda: fit_line_by_line(sensor, ego, ref_lines), lambda: sensor.Update(ego, ref_lines)):
+            t_best = np.inf
+            for _ in range(5):
+                t0 = time.perf_counter()
+                for _ in range(20):
+                    update()
+                t_best = min(t_best, (time.perf_counter() - t0) / 20)
+            timings.append(t_best)
+        print(f"{n_lines:>7} {timings[0] * 1e6:>18.1f} {timings[1] * 1e6:>13.1f}")
+
+
+def benchmark_object_update():
+    """
+    one object step and pose read, s-cursor against a search of the whole
+    reference line every step (get_point_from_S)
+    """
+    import time
+
+    def best_time(function, number):
+        t_best = np.inf
+        for _ in range(5):
+            t0 = time.perf_counter()
+            for _ in range(number):
+                function()
+            t_best = min(t_best, (time.perf_counter() - t0) / number)
+        return t_best
+
+    print(f"{'points':>9} {'search [us]':>12} {'cursor [us]':>12}")
+    for n_points in (500, 50000, 1000000):
+        line = reference_line(10.0, 0.05, 0.0)
+        line.points = line.get_ref_points(1000.0 * n_points / 500, n_points)
+        target = object("car", 1.9, 5.0, 0.0, 20.0, line, 1.7)
+        state = {"loc": line.points[0]}
+
+        def search():
+            state["loc"] = line.get_point_from_S(state["loc"], 2.0)
+            return state["loc"].x, state["loc"].y, state["loc"].angle
+
+        def cursor():
+            target.Update(0.1)
+            return target.loc.x, target.loc.y, target.loc.angle
+
+        print(f"{n_points:>9} {best_time(search, 2000) * 1e6:>12.2f} {best_time(cursor, 2000) * 1e6:>12.2f}")
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["benchmark"]:
+    benchmark_queries()
+    check_long_run()
+    benchmark_object_update()
+    benchmark_bev_road()
+elif __name__ == "__main__":
+    import matplotlib.pyplot as plt
 
     reference = reference_line(a0=10, a1=0.05, a2=0.002)
 
@@ -173,8 +720,8 @@ if __name__ == "__main__":
     sensor.register_ref_line(reference)
     trajectory = reference.get_ref_points(field_size["x_max"])  # get reference line
 
-    trajectory_x = [pt.x for pt in reference.points]
-    trajectory_y = [pt.y for pt in reference.points]
+    trajectory_x = reference.points.x
+    trajectory_y = reference.points.y
     fig, ax = plt.subplots()
     # set x-axis from -10 to 10
     ax.set_xlim(-10, 100)
@@ -19,7 +19,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   syntax='proto2',
   serialized_options=None,
   create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\x15proto/sim_debug.proto\"q\n\x13vehicle_state_debug\x12\t\n\x01x\x18\x01 \x01(\x02\x12\t\n\x01y\x18\x02 \x01(\x02\x12\r\n\x05theta\x18\x05 \x01(\x02\x12\r\n\x05kappa\x18\x06 \x01(\x02\x12\x10\n\x08velocity\x18\x03 \x01(\x02\x12\x14\n\x0c\x61\x63\x63\x65leration\x18\x04 \x01(\x02\"<\n\x10\x63ontroller_debug\x12\x12\n\nkappa_rate\x18\x01 \x01(\x02\x12\x14\n\x0c\x61\x63\x63\x65leration\x18\x02 \x01(\x02\"z\n\tsim_debug\x12\x31\n\x13vehicle_state_debug\x18\x01 \x03(\x0b\x32\x14.vehicle_state_debug\x12+\n\x10\x63ontroller_debug\x18\x02 \x03(\x0b\x32\x11.controller_debug\x12\r\n\x05times\x18\x03 \x03(\x02'
+  serialized_pb=b'\n\x15proto/sim_debug.proto\"q\n\x13vehicle_state_debug\x12\t\n\x01x\x18\x01 \x01(\x02\x12\t\n\x01y\x18\x02 \x01(\x02\x12\r\n\x05theta\x18\x05 \x01(\x02\x12\r\n\x05kappa\x18\x06 \x01(\x02\x12\x10\n\x08velocity\x18\x03 \x01(\x02\x12\x14\n\x0c\x61\x63\x63\x65leration\x18\x04 \x01(\x02\"<\n\x10\x63ontroller_debug\x12\x12\n\nkappa_rate\x18\x01 \x01(\x02\x12\x14\n\x0c\x61\x63\x63\x65leration\x18\x02 \x01(\x02\"\x8e\x01\n\tsim_debug\x12\x31\n\x13vehicle_state_debug\x18\x01 \x03(\x0b\x32\x14.vehicle_state_debug\x12+\n\x10\x63ontroller_debug\x18\x02 \x03(\x0b\x32\x11.controller_debug\x12\r\n\x05times\x18\x03 \x03(\x02\x12\x12\n\nstep_times\x18\x04 \x03(\x02'
 )
 
 
@@ -160,6 +160,13 @@ _SIM_DEBUG = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='step_times', full_name='sim_debug.step_times', index=3,
+      number=4, type=2, cpp_type=6, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
   ],
   extensions=[
   ],
@@ -172,8 +179,8 @@ _SIM_DEBUG = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=202,
-  serialized_end=324,
+  serialized_start=203,
+  serialized_end=345,
 )
 
 _SIM_DEBUG.fields_by_name['vehicle_state_debug'].message_type = _VEHICLE_STATE_DEBUG
@@ -1,6 +1,6 @@
+from collections import OrderedDict
 import numpy as np
 from numpy.linalg import solve
-import matplotlib.pyplot as plt
 from math import *
 from utilities import *
 from vehicle_model import vehicle_status
@@ -11,6 +11,8 @@ Safe_distance = 0.5
 
 
 class Point:
+    __slots__ = ("x", "y", "dy", "ddy", "kappa", "dkappa", "s", "angle")
+
     def __init__(
         self,
         x: float,
@@ -32,71 +34,446 @@ class Point:
         self.angle = angle
 
 
+class PointBatch:
+    """
+    array backed sequence of reference points, one array per Point field
+    (struct of arrays, rows of one contiguous table). Indexing with an int
+    gives a Point copy, with a slice / index array a PointBatch.
+    """
+
+    fields = ("x", "y", "dy", "ddy", "kappa", "dkappa", "s", "angle")
+
+    def __init__(self, table: np.ndarray):
+        self.table = table  # [len(fields), n]
+        for i, name in enumerate(self.fields):
+            setattr(self, name, table[i])
+
+    @classmethod
+    def from_points(cls, points: list):
+        return cls(
+            np.array([[getattr(pt, name) for pt in points] for name in cls.fields])
+        )
+
+    def __len__(self):
+        return self.table.shape[1]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Point(*self.table[:, index].tolist())
+        return PointBatch(self.table[:, index])
+
+    def __iter__(self):
+        for column in self.table.T.tolist():
+            yield Point(*column)
+
+
+class nearest_point_projector:
+    """
+    Projects query positions onto a PointBatch polyline.
+
+    The last matched index is kept per key (one key per querying vehicle),
+    so a query only scans a fixed window around it. While the best match
+    lands on the window border the window slides after it; if it is still
+    on the border after max_slides the vehicle jumped (or is new) and the
+    index is found again with a KD-tree. The position
+    is then projected onto the two segments next to the matched point,
+    which gives a continuous s instead of the s of the nearest sample.
+    """
+
+    def __init__(self, points: PointBatch, window: int = 10):
+        self.points = points
+        self.window = window
+        self.max_slides = 4
+        self.tree = None  # built on the first global search
+        self.last_index = {}
+
+    def get_tree(self):
+        if self.tree is None:
+            from scipy.spatial import cKDTree  # only needed for global searches
+
+            self.tree = cKDTree(np.column_stack([self.points.x, self.points.y]))
+        return self.tree
+
+    def global_index(self, x: float, y: float) -> int:
+        return int(self.get_tree().query([x, y])[1])
+
+    def global_index_array(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        stateless nearest sample of many positions at once
+        """
+        return self.get_tree().query(np.column_stack([x, y]))[1]
+
+    def nearest_index(self, x: float, y: float, key=None) -> int:
+        """
+        index of the nearest sample, windowed around the last match of key
+        """
+        n = len(self.points)
+        i = self.last_index.get(key)
+        for _ in range(self.max_slides + 1 if i is not None else 0):
+            lo = max(i - self.window, 0)
+            hi = min(i + self.window + 1, n)
+            dist2 = (self.points.x[lo:hi] - x) ** 2 + (self.points.y[lo:hi] - y) ** 2
+            i = lo + int(np.argmin(dist2))
+            if not ((i == lo and lo > 0) or (i == hi - 1 and hi < n)):
+                break  # inside the window, local minimum
+        else:
+            i = None
+        if i is None:
+            i = self.global_index(x, y)
+        if key is not None:
+            self.last_index[key] = i
+        return i
+
+    def project_S(self, x: float, y: float, key=None) -> float:
+        """
+        s of the foot point on the segments next to the nearest sample
+        """
+        x, y = float(x), float(y)
+        i = self.nearest_index(x, y, key)
+        # the nearest sample and its neighbours as plain floats
+        lo = max(i - 1, 0)
+        px, py, ps = self.points.table[[0, 1, 6], lo : i + 2].tolist()
+        i -= lo
+        best_s, best_dist2 = ps[i], (px[i] - x) ** 2 + (py[i] - y) ** 2
+        for a in range(len(px) - 1):
+            ex, ey = px[a + 1] - px[a], py[a + 1] - py[a]
+            t = ((x - px[a]) * ex + (y - py[a]) * ey) / (ex * ex + ey * ey)
+            t = min(max(t, 0.0), 1.0)
+            dist2 = (px[a] + t * ex - x) ** 2 + (py[a] + t * ey - y) ** 2
+            if dist2 < best_dist2:
+                best_s, best_dist2 = ps[a] + t * (ps[a + 1] - ps[a]), dist2
+        return best_s
+
+
+# Gauss-Legendre 积分节点和权重, 区间 [-1, 1]
+gauss_nodes, gauss_weights = np.polynomial.legendre.leggauss(8)
+gauss_nodes_list = gauss_nodes.tolist()
+gauss_weights_list = gauss_weights.tolist()
+# largest change of y' = a1 + 2 a2 x over one quadrature piece. sqrt(1 + y'^2)
+# has branch points 1 / (2 |a2|) off the real axis, with 2 |a2| h <= 0.5 the
+# 8 point rule is below 1e-15 m per m of piece, at 1.0 it is 2e-12, at 5 it is 1e-4
+max_slope_change = 0.5
+
+
+def get_max_step(a2: float) -> float:
+    """
+    longest x interval one Gauss-Legendre evaluation may cover for curvature a2
+    """
+    return max_slope_change / (2.0 * abs(a2)) if a2 else inf
+
+
+def get_arc_length(a1: float, a2: float, a, b):
+    """
+    arc length of y = a0 + a1 x + a2 x^2 from a to b, elementwise. Every
+    interval is cut into equal pieces no longer than get_max_step(a2)
+    """
+    a = np.asarray(a, dtype=float)
+    length = np.asarray(b, dtype=float) - a
+    longest = float(np.max(np.abs(length), initial=0.0))
+    n_pieces = max(int(ceil(longest / get_max_step(a2) * (1.0 - 1e-12))), 1)
+    half = 0.5 * length / n_pieces
+    total = 0.0
+    for piece in range(n_pieces):
+        center = a + (2 * piece + 1) * half
+        dy = a1 + 2.0 * a2 * (center[..., None] + half[..., None] * gauss_nodes)
+        total = total + half * (np.sqrt(1.0 + dy * dy) @ gauss_weights)
+    return total
+
+
+class arc_length_table:
+    """
+    Arc length s(x) = integral of sqrt(1 + y'^2) from 0 to x of the
+    polynomial of a reference_line, and its inverse x(s).
+
+    Knots x_k are spaced at most segment_length and get_max_step(a2) apart
+    on [0, x_max], s_k comes from Gauss-Legendre quadrature on every segment.
+    The quadrature error stays at rounding level, about 1e-15 of s (1e-12 m
+    over 2 km of a gentle curve), also past [0, x_max] where the interval to
+    the end knot is cut into pieces. x(s) starts from a cubic Hermite spline through (s_k, x_k) with
+    the exact slopes dx/ds = 1 / sqrt(1 + y'^2) and is Newton iterated on s(x)
+    until |s(x) - s| <= tol; since dS/dx >= 1 that also bounds the x error.
+    s(x) finds its segment in O(1), x(s) in O(log n).
+    """
+
+    def __init__(self, ref_line, x_max: float, segment_length: float = 10.0):
+        self.ref_line = ref_line
+        step = min(segment_length, get_max_step(ref_line.a2))
+        n_segments = max(int(ceil(x_max / step)), 1)
+        self.h = x_max / n_segments
+        self.x = np.linspace(0.0, x_max, n_segments + 1)
+        self.s = np.zeros_like(self.x)
+        np.cumsum(self.integrate(self.x[:-1], self.x[1:]), out=self.s[1:])
+        self.dxds = 1.0 / self.get_dSdx(self.x)
+        # Hermite segments as x = c0 + c1 t + c2 t^2 + c3 t^3, t = (s - s_k) / h_k,
+        # rows s_k, 1 / h_k, c0, c1, c2, c3, one gather per query
+        h = np.diff(self.s)
+        m0 = h * self.dxds[:-1]
+        m1 = h * self.dxds[1:]
+        dx = np.diff(self.x)
+        self.segments = np.array(
+            [self.s[:-1], 1.0 / h, self.x[:-1], m0, 3.0 * dx - 2.0 * m0 - m1, m0 + m1 - 2.0 * dx]
+        )
+
+    def get_dSdx(self, x):
+        dy = self.ref_line.a1 + 2.0 * self.ref_line.a2 * x
+        return np.sqrt(1.0 + dy * dy)
+
+    def integrate(self, a, b):
+        """
+        arc length from a to b, Gauss-Legendre quadrature, elementwise
+        """
+        return get_arc_length(self.ref_line.a1, self.ref_line.a2, a, b)
+
+    def get_S(self, x):
+        """
+        arc length at x
+        """
+        x = np.asarray(x, dtype=float)
+        k = np.minimum(np.maximum((x // self.h).astype(int), 0), self.x.size - 2)
+        return self.s[k] + self.integrate(self.x[k], x)
+
+    def get_X(self, s, tol: float = 1e-9, max_iterations: int = 50):
+        """
+        x at arc length s with |s(x) - s| <= tol, Newton steps kept inside a
+        bracket of x and replaced by bisection where they leave it
+        """
+        s = np.asarray(s, dtype=float)
+        k = np.searchsorted(self.s, s, side="right") - 1
+        k = np.minimum(np.maximum(k, 0), self.s.size - 2)
+        s_k, inv_h, c0, c1, c2, c3 = self.segments[:, k]
+        t = (s - s_k) * inv_h
+        x = ((c3 * t + c2) * t + c1) * t + c0
+        # s(x) grows at least as fast as x, x_k + (s - s_k) bounds x from the
+        # side of knot k beyond the ends of the table
+        lo = self.x[k] + np.minimum(s - s_k, 0.0)
+        hi = self.x[k + 1] + np.maximum(s - self.s[k + 1], 0.0)
+        x = np.minimum(np.maximum(x, lo), hi)
+        for _ in range(max_iterations):
+            error = self.get_S(x) - s
+            # a bracket at rounding level ends the iteration for a tol below it
+            if np.all((np.abs(error) <= tol) | (hi - lo <= 1e-15 * np.maximum(np.abs(x), 1.0))):
+                break
+            lo = np.where(error < 0.0, x, lo)
+            hi = np.where(error > 0.0, x, hi)
+            x = x - error / self.get_dSdx(x)
+            outside = ~((x > lo) & (x < hi))
+            x = np.where(outside, 0.5 * (lo + hi), x)
+        return x
+
+    def get_s(self, x: float) -> float:
+        """
+        get_S of one float without numpy overhead
+        """
+        a1 = self.ref_line.a1
+        a2 = self.ref_line.a2
+        k = min(max(int(x // self.h), 0), self.x.size - 2)
+        x_k = float(self.x[k])
+        n_pieces = max(int(ceil(abs(x - x_k) / get_max_step(a2) * (1.0 - 1e-12))), 1)
+        half = 0.5 * (x - x_k) / n_pieces
+        s = float(self.s[k])
+        for piece in range(n_pieces):
+            center = x_k + (2 * piece + 1) * half
+            for node, weight in zip(gauss_nodes_list, gauss_weights_list):
+                dy = a1 + 2.0 * a2 * (center + half * node)
+                s += half * weight * sqrt(1.0 + dy * dy)
+        return s
+
+    def get_x(self, s: float, tol: float = 1e-9, max_iterations: int = 50) -> float:
+        """
+        get_X of one float without numpy overhead
+        """
+        a1 = self.ref_line.a1
+        a2 = self.ref_line.a2
+        k = min(max(int(np.searchsorted(self.s, s, side="right")) - 1, 0), self.s.size - 2)
+        s_k, inv_h, c0, c1, c2, c3 = self.segments[:, k].tolist()
+        t = (s - s_k) * inv_h
+        x = ((c3 * t + c2) * t + c1) * t + c0
+        x_k, x_k1 = self.x[k : k + 2].tolist()
+        lo = x_k + min(s - s_k, 0.0)
+        hi = x_k1 + max(s - float(self.s[k + 1]), 0.0)
+        x = min(max(x, lo), hi)
+        for _ in range(max_iterations):
+            error = self.get_s(x) - s
+            if abs(error) <= tol or hi - lo <= 1e-15 * max(abs(x), 1.0):
+                break
+            if error < 0.0:
+                lo = x
+            else:
+                hi = x
+            dy = a1 + 2.0 * a2 * x
+            x -= error / sqrt(1.0 + dy * dy)
+            if not lo < x < hi:
+                x = 0.5 * (lo + hi)
+        return x
+
+
 class reference_line:
+    # get_ref_points 的结果按 (系数, 预瞄距离, 点数) 缓存, 所有参考线共享, LRU 淘汰
+    points_cache = OrderedDict()
+    points_cache_size = 64
+
     def __init__(self, a0: float, a1: float, a2: float):
         self.a0 = a0
         self.a1 = a1
         self.a2 = a2
-        self.points = self.get_ref_points(500)
+        self.points: PointBatch = self.get_ref_points(500)
         self.detectable = False   # This is a center line cannot be detected by camera
     def get_point(self, dist: float):
         """
         根据给定距离[X - direction]，返回参考线点。
             Args:
-                dist (float): X - direction distance.
+                dist (float | np.ndarray): X - direction distance.
             Returns:
-                x, y, dy, ddy, kappa, dkappa, angle
+                x, y, dy, ddy, kappa, dkappa, angle (与 dist 同形状)
         """
         x = dist
         y = self.a0 + self.a1 * dist + self.a2 * dist**2
         dy = self.a1 + 2 * self.a2 * dist
-        ddy = 2 * self.a2
+        ddy = 2 * self.a2 + 0.0 * dist
         kappa = dy / (1 + dy**2) ** (3 / 2)
         dkappa = (ddy * dy - dy**3) / (1 + dy**2) ** (5 / 2)
-        angle = atan(dy)
+        angle = np.arctan(dy)
         return x, y, dy, ddy, kappa, dkappa, angle
 
-    def get_ref_points(self, pre_view_d: float):
+    def get_ref_points(self, pre_view_d: float, n_points: int = 500):
         """
         根据预瞄的距离，生成参考线。
 
             Args:
                 preview_d (float): Global 坐标下, X方向上的预瞄的距离。
+                n_points (int): 离散点数
 
             Returns:
-                points (list) : 离散后的参考线点集合。
-        """
-        points = []
-        x_scat = np.linspace(0, pre_view_d, 500)
-        for i in range(len(x_scat)):
-            if i == 0:
-                x, y, dy, ddy, kappa, dkappa, angle = self.get_point(x_scat[i])
-                points.append(Point(x, y, dy, ddy, kappa, dkappa, 0.0, angle))
-            else:
-                x, y, dy, ddy, kappa, dkappa, angle = self.get_point(x_scat[i])
-                dx = x - points[-1].x
-                dy = y - points[-1].y
-                s = points[-1].s + np.sqrt(dx**2 + dy**2)
-                points.append(Point(x, y, dy, ddy, kappa, dkappa, s, angle))
+                points (PointBatch) : 离散后的参考线点集合, 与相同参数的调用共享, 只读。
+        """
+        key = (type(self), self.a0, self.a1, self.a2, pre_view_d, n_points)
+        points = self.points_cache.get(key)
+        if points is not None:
+            self.points_cache.move_to_end(key)
+            return points
+        x_scat = np.linspace(0, pre_view_d, n_points)
+        x, y, dy, ddy, kappa, dkappa, angle = self.get_point(x_scat)
+        # s 为逐段 Gauss-Legendre 积分的弧长, 与采样点数无关, 不建 arc_length_table
+        s = np.zeros_like(x_scat)
+        np.cumsum(get_arc_length(self.a1, self.a2, x_scat[:-1], x_scat[1:]), out=s[1:])
+        table = np.array([x, y, dy, ddy, kappa, dkappa, s, angle])
+        table.flags.writeable = False
+        points = PointBatch(table)
+        self.points_cache[key] = points
+        if len(self.points_cache) > self.points_cache_size:
+            self.points_cache.popitem(last=False)
         return points
 
-    def get_nearest_point(self, x: float, y: float):
+    def get_arc_length_table(self) -> arc_length_table:
+        """
+        arc_length_table over the x range of self.points, built on first use
+        """
+        x_max = float(self.get_point_arrays().x[-1])
+        table = getattr(self, "_arc_length_table", None)
+        if table is None or table.x[-1] != x_max:
+            self._arc_length_table = arc_length_table(self, x_max)
+        return self._arc_length_table
+
+    def get_points_at_S(self, s_array) -> PointBatch:
+        """
+        根据弧长 s, 批量返回多项式上的精确点, 不经过离散点插值。
+
+            Args:
+                s_array: 弧长 s (从 x = 0 起)
+
+            Returns:
+                PointBatch, s 超出参考线范围时沿多项式外推
+        """
+        s = np.asarray(s_array, dtype=float).ravel()
+        x, y, dy, ddy, kappa, dkappa, angle = self.get_point(self.get_arc_length_table().get_X(s))
+        return PointBatch(np.array([x, y, dy, ddy, kappa, dkappa, s, angle]))
+
+    def get_point_at_S(self, s: float) -> Point:
+        """
+        根据弧长 s, 返回多项式上的精确点。
+
+            Args:
+                s (float): 弧长 s (从 x = 0 起)
+
+            Returns:
+                Point
+        """
+        x, y, dy, ddy, kappa, dkappa, angle = self.get_point(self.get_arc_length_table().get_x(float(s)))
+        return Point(x, y, dy, ddy, kappa, dkappa, s, float(angle))
+
+    def get_nearest_point(self, x: float, y: float, key=None):
         """
         calculate the nearest point
             Args:
                 x (float): x
                 y (float): y
+                key: querying vehicle, None 时为无状态的全局搜索
             Returns:
-                nearest_point (Point)
+                nearest_point (Point), 各字段插值到 (x, y) 在参考线上的投影点
+        """
+        projector = self.get_projector()
+        return Point(*self.interpolate_S(projector.project_S(x, y, key)).tolist())
+
+    def get_projector(self) -> nearest_point_projector:
+        """
+        nearest_point_projector of the current points, reset when self.points
+        is replaced
+        """
+        points = self.get_point_arrays()
+        projector = getattr(self, "_projector", None)
+        if projector is None or projector.points is not points:
+            self._projector = nearest_point_projector(points)
+        return self._projector
+
+    def get_point_arrays(self) -> PointBatch:
+        """
+        self.points as a PointBatch, a list of Point assigned to self.points
+        is converted once
         """
-        min_dist = np.inf
-        nearest_point = Point(0, 0, 0, 0, 0, 0, 0, 0)
-        for point in self.points:
-            dist = np.sqrt((point.x - x) ** 2 + (point.y - y) ** 2)
-            if dist < min_dist:
-                min_dist = dist
-                nearest_point = point
-        return nearest_point
+        if isinstance(self.points, PointBatch):
+            return self.points
+        if getattr(self, "_point_arrays_src", None) is not self.points:
+            self._point_arrays = PointBatch.from_points(self.points)
+            self._point_arrays_src = self.points
+        return self._point_arrays
+
+    def get_point_columns(self) -> list:
+        """
+        table of get_point_arrays as nested lists, for cheap scalar reads of
+        objects walking along the line
+        """
+        points = self.get_point_arrays()
+        if getattr(self, "_point_columns_src", None) is not points:
+            self._point_columns = points.table.tolist()
+            self._point_columns_src = points
+        return self._point_columns
+
+    def get_points_from_S(self, nearest_point: Point, ds_array) -> PointBatch:
+        """
+        根据s值, 批量返回参考线点。
+
+            Args:
+                nearest_point (Point): 最近点
+                ds_array: s值 (相对最近点)
+
+            Returns:
+                PointBatch, 各字段在相邻两点间线性插值, 超出参考线两端时按首/末段线性外推
+        """
+        s = nearest_point.s + np.asarray(ds_array, dtype=float).ravel()
+        return PointBatch(self.interpolate_S(s))
+
+    def interpolate_S(self, s):
+        """
+        linear interpolation of all Point fields at s, columns of the table
+        """
+        table = self.get_point_arrays().table
+        s_points = table[6]
+        # points[i - 1].s <= s < points[i].s
+        i = np.searchsorted(s_points, s, side="right")
+        i = np.minimum(np.maximum(i, 1), s_points.size - 1)
+        start = table[:, i - 1]
+        t = (s - s_points[i - 1]) / (s_points[i] - s_points[i - 1])
+        return start + t * (table[:, i] - start)
 
     def get_point_from_S(self, nearest_point: Point, ds: float):
         """
@@ -107,30 +484,9 @@ class reference_line:
                 ds (float): s值
 
             Returns:
-                x, y, dy, ddy, kappa, dkappa, angle
-        """
-        s = nearest_point.s + ds
-        for i in range(len(self.points)):
-            if self.points[i].s > s:
-                rho_s = self.points[i].s - s
-                x = self.points[i].x + rho_s * (self.points[i].x - self.points[i - 1].x)
-                y = self.points[i].y + rho_s * (self.points[i].y - self.points[i - 1].y)
-                dy = self.points[i].dy + rho_s * (
-                    self.points[i].dy - self.points[i - 1].dy
-                )
-                ddy = self.points[i].ddy + rho_s * (
-                    self.points[i].ddy - self.points[i - 1].ddy
-                )
-                kappa = self.points[i].kappa + rho_s * (
-                    self.points[i].kappa - self.points[i - 1].kappa
-                )
-                dkappa = self.points[i].dkappa + rho_s * (
-                    self.points[i].dkappa - self.points[i - 1].dkappa
-                )
-                angle = self.points[i].angle + rho_s * (
-                    self.points[i].angle - self.points[i - 1].angle
-                )
-                return Point(x, y, dy, ddy, kappa, dkappa, s, angle)
+                Point
+        """
+        return Point(*self.interpolate_S(nearest_point.s + ds).tolist())
 
     def get_inline_pointY_frm_x(self, x: float):
         return self.a0 + self.a1 * x + self.a2 * x**2
@@ -153,24 +509,153 @@ class reference_line:
         )
 mid =  (field_size["y_max"] + field_size["y_min"]) / 2
 
-straight_road = reference_line(mid, 0.0, 0.0)
+# 模块级道路 (a0, a1, a2), 第一次访问 referenceline.straight_road 等时才生成
+roads = {
+    "straight_road": (mid, 0.0, 0.0),
+    "left_curve_road": (mid, 0.05, 0.01),
+    "right_curve_road": (mid, -0.05, -0.01),
+}
 
-left_curve_road = reference_line(mid, 0.05, 0.01)
 
-right_curve_road = reference_line(mid, -0.05, -0.01)
+def __getattr__(name: str):
+    if name in roads:
+        road = globals()[name] = reference_line(*roads[name])
+        return road
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # do some test
 if __name__ == "__main__":
 
+    ### get_points_from_S self checks ###
+    # straight line: linear interpolation is exact
+    line = reference_line(2.0, 0.5, 0.0)
+    ds = np.linspace(0.0, 400.0, 37)
+    batch = line.get_points_from_S(line.points[0], ds)
+    assert np.allclose(batch.s, ds)
+    assert np.allclose(batch.x, ds / sqrt(1.0 + 0.5**2))
+    assert np.allclose(batch.y, 2.0 + 0.5 * batch.x)
+    assert np.allclose(batch.angle, atan(0.5))
+    # on a grid point every field equals the stored point
+    curve = reference_line(10.0, 0.005, 0.0005)
+    for i in (0, 1, 250, 498):
+        pt = curve.get_point_from_S(curve.points[0], curve.points[i].s)
+        for name in PointBatch.fields:
+            assert isclose(getattr(pt, name), getattr(curve.points[i], name), abs_tol=1e-9)
+    # halfway between two points every field is the average of the two
+    p0, p1 = curve.points[100], curve.points[101]
+    mid = curve.get_point_from_S(p0, 0.5 * (p1.s - p0.s))
+    for name in PointBatch.fields:
+        assert isclose(getattr(mid, name), 0.5 * (getattr(p0, name) + getattr(p1, name)))
+    # scalar and batch queries agree, also past the end (linear extrapolation)
+    ds = np.linspace(-1.0, curve.points[-1].s + 5.0, 50)
+    batch = curve.get_points_from_S(curve.points[10], ds)
+    for k, d in enumerate(ds):
+        pt = curve.get_point_from_S(curve.points[10], d)
+        assert isclose(pt.x, batch.x[k]) and isclose(pt.kappa, batch.kappa[k])
+    assert np.all(np.diff(batch.x) > 0.0)
+    print("get_points_from_S checks passed")
+
+    ### arc length table ###
+    # closed form arc length of y = a0 + a1 x + a2 x^2
+    def parabola_S(a1, a2, x):
+        F = lambda u: (u * np.sqrt(1.0 + u**2) + np.arcsinh(u)) / (4.0 * a2)
+        return F(a1 + 2.0 * a2 * x) - F(a1)
+
+    table = curve.get_arc_length_table()
+    x_test = np.linspace(-50.0, 700.0, 301)
+    assert np.allclose(table.get_S(x_test), parabola_S(0.005, 0.0005, x_test), rtol=0.0, atol=1e-9)
+    assert np.allclose(curve.points.s, parabola_S(0.005, 0.0005, curve.points.x), rtol=0.0, atol=1e-9)
+    s_test = np.linspace(-10.0, table.s[-1] + 100.0, 1001)
+    exact = curve.get_points_at_S(s_test)
+    assert np.allclose(parabola_S(0.005, 0.0005, exact.x), s_test, rtol=0.0, atol=1e-7)
+    inside = (s_test >= 0.0) & (s_test <= table.s[-1])
+    assert np.allclose(parabola_S(0.005, 0.0005, exact.x[inside]), s_test[inside], rtol=0.0, atol=1e-9)
+    assert np.allclose(exact.y, curve.get_inline_pointY_frm_x(exact.x))
+    assert isclose(curve.get_point_at_S(123.0).x, curve.get_points_at_S([123.0]).x[0])
+    # sharp curve and coarse segments: knots follow the curvature, x(s) is
+    # iterated to tol also from a poor Hermite guess far past the ends
+    sharp = reference_line(10.0, 0.005, 0.05)
+    for segment_length in (10.0, 50.0, 200.0):
+        table = arc_length_table(sharp, 2000.0, segment_length)
+        x_test = np.linspace(-300.0, 2300.0, 1001)
+        s_exact = parabola_S(0.005, 0.05, x_test)
+        assert np.allclose(table.get_S(x_test), s_exact, rtol=1e-14, atol=1e-12)
+        s_test = np.linspace(-300.0, table.s[-1] + 300.0, 1001)
+        x_found = table.get_X(s_test)
+        assert np.allclose(parabola_S(0.005, 0.05, x_found), s_test, rtol=1e-14, atol=1e-9)
+        for k in range(0, s_test.size, 50):
+            assert isclose(table.get_x(s_test[k]), x_found[k], rel_tol=1e-12, abs_tol=1e-9)
+    print("arc length checks passed")
+
+    # interpolated points against the exact polynomial, per sample count
+    print("points   chord s error [m]   interpolated error [m]   table [kB]")
+    for n_points in (50, 500, 5000):
+        sampled = reference_line(10.0, 0.005, 0.0005)
+        sampled.points = sampled.get_ref_points(2000.0, n_points)
+        x_scat = sampled.points.x
+        chord_s = np.r_[0.0, np.cumsum(np.hypot(np.diff(x_scat), np.diff(sampled.points.y)))]
+        s_query = np.linspace(0.0, sampled.points.s[-1], 10007)
+        interpolated = sampled.interpolate_S(s_query)
+        exact = sampled.get_points_at_S(s_query)
+        error = np.hypot(interpolated[0] - exact.x, interpolated[1] - exact.y).max()
+        print(
+            f"{n_points:>6} {abs(chord_s[-1] - sampled.points.s[-1]):>19.2e}"
+            f" {error:>24.2e} {sampled.points.table.nbytes / 1e3:>12.1f}"
+        )
+    import tracemalloc
+
+    tracemalloc.start()
+    table = arc_length_table(sampled, 2000.0)
+    table_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"arc length table over 2000 m: {table_size / 1e3:.1f} kB, s at rounding level")
+
+    ### nearest point projection ###
+    # straight line: foot point s = distance along the line
+    for px, py in ((10.3, 8.0), (123.45, 40.0), (300.0, 100.0)):
+        pt = line.get_nearest_point(px, py)
+        foot = (px + 0.5 * (py - 2.0)) / sqrt(1.0 + 0.5**2)
+        assert isclose(pt.s, foot, abs_tol=1e-9)
+        assert isclose(pt.y, 2.0 + 0.5 * pt.x, abs_tol=1e-9)
+    # windowed tracking agrees with the stateless search, also after a jump
+    track_x = np.r_[np.linspace(0.0, 150.0, 300), np.linspace(400.0, 450.0, 20)]
+    for k, tx in enumerate(track_x):
+        ty = curve.get_inline_pointY_frm_x(tx) + 1.5 * sin(0.1 * k)
+        tracked = curve.get_nearest_point(tx, ty, key="ego")
+        assert isclose(tracked.s, curve.get_nearest_point(tx, ty).s, abs_tol=1e-9)
+    print("nearest point checks passed")
+
+    ### query cost against reference line size ###
+    import time
+
+    print("points   global argmin [us]   windowed [us]")
+    for n_points in (500, 5000, 50000):
+        long_line = reference_line(10.0, 0.005, 0.0005)
+        long_line.points = long_line.get_ref_points(2000.0, n_points)
+        track_x = np.linspace(0.0, 1500.0, 2000)
+        track_y = long_line.get_inline_pointY_frm_x(track_x) + 1.0
+        points = long_line.points
+        t0 = time.perf_counter()
+        for tx, ty in zip(track_x, track_y):
+            points[int(np.argmin(np.hypot(points.x - tx, points.y - ty)))]
+        t1 = time.perf_counter()
+        for tx, ty in zip(track_x, track_y):
+            long_line.get_nearest_point(tx, ty, key="ego")
+        t2 = time.perf_counter()
+        print(
+            f"{n_points:>6} {(t1 - t0) / track_x.size * 1e6:>20.1f}"
+            f" {(t2 - t1) / track_x.size * 1e6:>15.1f}"
+        )
+
+    import matplotlib.pyplot as plt
+
     preview_dt = 20.0  # s
     velocity = 10.0
 
     preview_dist = velocity * preview_dt
     ref_line = reference_line(10.0, 0.005, 0.0005)
     plan_traj = ref_line.get_ref_points(preview_dist)
-    X = [p.x for p in plan_traj]
-    Y = [p.y for p in plan_traj]
     plt.xlim(-5, 200)
     plt.ylim(-5, 100)
-    plt.scatter(X, Y, s=1, c="r")
+    plt.scatter(plan_traj.x, plan_traj.y, s=1, c="r")
     plt.show()
@@ -1,12 +1,197 @@
 import numpy as np
 from numpy.linalg import solve
-import matplotlib.pyplot as plt
 import pickle
+import bisect
 import datetime
+import json
 import sys
 import os
+import time
+from array import array
 from proto import sim_debug_pb2
-import tkinter.filedialog
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_varint(f):
+    """
+    varint from a binary file, None at end of file
+    """
+    shift, value = 0, 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+# .simcol layout: magic, uint32 header size, json header, 64 byte aligned columns
+column_magic = b"SIMCOL01"
+column_align = 64
+# time index: first sim time of every chunk_size steps
+chunk_size = 4096
+# .simlog time index, one (first time, byte offset) entry per index_interval frames
+index_dtype = np.dtype([("t", "<f8"), ("offset", "<i8")])
+index_interval = 256
+
+
+# per step values stored directly in sim_debug next to times, may be empty
+step_columns = ["step_times"]
+
+
+def get_column_names():
+    """
+    one column per field of vehicle_state_debug / controller_debug, plus times
+    and step_columns
+    """
+    return (
+        ["times"]
+        + step_columns
+        + [
+            f"vehicle_state_debug.{field.name}"
+            for field in sim_debug_pb2.vehicle_state_debug.DESCRIPTOR.fields
+        ]
+        + [
+            f"controller_debug.{field.name}"
+            for field in sim_debug_pb2.controller_debug.DESCRIPTOR.fields
+        ]
+    )
+
+
+def get_columns(data: sim_debug_pb2.sim_debug) -> dict:
+    """
+    sim_debug -> {column name: float32 array}
+    """
+    columns = {"times": np.array(data.times, dtype=np.float32)}
+    for name in step_columns:
+        values = getattr(data, name)
+        if len(values) == len(data.times):
+            columns[name] = np.array(values, dtype=np.float32)
+        else:  # not recorded
+            columns[name] = np.full(len(data.times), np.nan, dtype=np.float32)
+    for name in get_column_names()[1 + len(step_columns) :]:
+        message, field = name.split(".")
+        columns[name] = np.array(
+            [getattr(item, field) for item in getattr(data, message)], dtype=np.float32
+        )
+    return columns
+
+
+def write_columns(file_name: str, columns: dict):
+    """
+    write equally long 1D arrays as one .simcol file
+    """
+    n = len(columns["times"])
+    layout = []
+    offset = 0
+    for name, column in columns.items():
+        column = np.ascontiguousarray(column)
+        layout.append({"name": name, "dtype": column.dtype.str, "offset": offset})
+        offset += -(-column.nbytes // column_align) * column_align
+    times = np.asarray(columns["times"], dtype=float)
+    header = {
+        "n": n,
+        "columns": layout,
+        "chunk_size": chunk_size,
+        "chunk_times": times[::chunk_size].tolist(),
+    }
+    header = json.dumps(header).encode()
+    data_start = -(-(len(column_magic) + 4 + len(header)) // column_align) * column_align
+    with open(file_name, "wb") as f:
+        f.write(column_magic)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for item, column in zip(layout, columns.values()):
+            f.seek(data_start + item["offset"])
+            f.write(np.ascontiguousarray(column).tobytes())
+        f.truncate(data_start + offset)
+
+
+class sim_column_log:
+    """
+    memory mapped .simcol file, every column is a zero copy NumPy view
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.mm = np.memmap(file_name, dtype=np.uint8, mode="r")
+        if bytes(self.mm[: len(column_magic)]) != column_magic:
+            raise ValueError(f"{file_name} is not a .simcol file")
+        start = len(column_magic) + 4
+        size = int(self.mm[len(column_magic) : start].view(np.uint32)[0])
+        header = json.loads(bytes(self.mm[start : start + size]))
+        data_start = -(-(start + size) // column_align) * column_align
+        self.n = header["n"]
+        self.chunk_size = header.get("chunk_size", max(self.n, 1))
+        self.chunk_times = header.get("chunk_times")
+        self.columns = {}
+        for item in header["columns"]:
+            dtype = np.dtype(item["dtype"])
+            begin = data_start + item["offset"]
+            end = begin + self.n * dtype.itemsize
+            self.columns[item["name"]] = self.mm[begin:end].view(dtype)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __len__(self):
+        return self.n
+
+    def keys(self):
+        return self.columns.keys()
+
+    def get_window(self, t_start: float, t_end: float):
+        """
+        index range [i0, i1) of the steps with t_start <= t <= t_end, only the
+        chunks that the chunk index points to are searched
+        """
+        lo, hi = 0, self.n
+        if self.chunk_times:
+            c0 = max(bisect.bisect_right(self.chunk_times, t_start) - 1, 0)
+            c1 = bisect.bisect_right(self.chunk_times, t_end)
+            lo, hi = c0 * self.chunk_size, min(c1 * self.chunk_size, self.n)
+        times = self.columns["times"][lo:hi]
+        i0 = lo + int(np.searchsorted(times, t_start, side="left"))
+        i1 = lo + int(np.searchsorted(times, t_end, side="right"))
+        return i0, i1
+
+    def read(self, t_start: float, t_end: float, fields=None) -> dict:
+        """
+        zero copy views of times and the requested fields in [t_start, t_end]
+        """
+        i0, i1 = self.get_window(t_start, t_end)
+        names = ["times"] + [name for name in fields or self.keys() if name != "times"]
+        return {name: self.columns[name][i0:i1] for name in names}
+
+
+def convert_to_columns(src_file: str, dst_file: str):
+    """
+    convert a .pkl or .simlog recording to .simcol, streams are converted
+    frame by frame
+    """
+    player = sim_data_player()
+    if not src_file.endswith(".simlog"):
+        write_columns(dst_file, get_columns(player.load_file(src_file)))
+        return
+    names = get_column_names()
+    buffers = {name: array("f") for name in names}
+    for frame in player.read_stream(src_file):
+        for name, column in get_columns(frame).items():
+            buffers[name].extend(column.tolist())
+    write_columns(
+        dst_file,
+        {name: np.frombuffer(buffer, dtype=np.float32) for name, buffer in buffers.items()},
+    )
 
 
 class sim_data_recorder:
@@ -37,17 +222,218 @@ class sim_data_recorder:
         return data
 
 
+class sim_stream_recorder(sim_data_recorder):
+    """
+    append-only recorder, every step is one length-delimited (varint length
+    + serialized sim_debug) frame. Frames go through a buffered file and are
+    flushed every flush_interval seconds, so memory stays constant and a
+    crash loses at most the last interval.
+
+    Every index_interval frames the time and byte offset of the frame is
+    appended to a <file>.idx side file, which lets sim_data_player.read seek
+    to a time window.
+    """
+
+    def __init__(self, name: str = "sim_data", flush_interval: float = 1.0):
+        super().__init__(name)
+        self.flush_interval = flush_interval
+        self.file = None
+        self.index_file = None
+        self.file_name = None
+        self.last_flush = 0.0
+        self.n_frames = 0
+        self.frame = sim_debug_pb2.sim_debug()
+
+    def get_file_name(self):
+        return os.path.splitext(super().get_file_name())[0] + ".simlog"
+
+    def open(self, file_name: str = None):
+        self.file_name = file_name or self.get_file_name()
+        self.file = open(self.file_name, "wb", buffering=1 << 16)
+        self.index_file = open(self.file_name + ".idx", "wb")
+        self.last_flush = time.monotonic()
+        self.n_frames = 0
+        return self
+
+    def write_step(
+        self,
+        t: float,
+        vehicle_state_debug=None,
+        controller_debug=None,
+        step_time: float = None,
+    ):
+        """
+        write one step, the debug messages are copied into the frame
+        """
+        if self.file is None:
+            self.open()
+        frame = self.frame
+        frame.Clear()
+        frame.times.append(t)
+        if step_time is not None:
+            frame.step_times.append(step_time)
+        if vehicle_state_debug is not None:
+            frame.vehicle_state_debug.add().CopyFrom(vehicle_state_debug)
+        if controller_debug is not None:
+            frame.controller_debug.add().CopyFrom(controller_debug)
+        self.write_frame(frame)
+
+    def write_frame(self, frame: sim_debug_pb2.sim_debug):
+        if self.n_frames % index_interval == 0:
+            entry = np.array([(frame.times[0], self.file.tell())], dtype=index_dtype)
+            self.index_file.write(entry.tobytes())
+        self.n_frames += 1
+        data = frame.SerializeToString()
+        self.file.write(encode_varint(len(data)))
+        self.file.write(data)
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.index_file.flush()  # after the frames it points to
+            self.last_flush = now
+
+    def save_data(self, data):
+        """
+        write a whole sim_debug as one frame per step
+        """
+        step_times = data.step_times if len(data.step_times) == len(data.times) else None
+        for i, t in enumerate(data.times):
+            self.write_step(
+                t,
+                data.vehicle_state_debug[i],
+                data.controller_debug[i],
+                None if step_times is None else step_times[i],
+            )
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.index_file.close()
+            self.file = None
+            self.index_file = None
+
+    def __enter__(self):
+        return self.open() if self.file is None else self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class sim_data_player:
     def __init__(self, name: str = "sim_data"):
         self.name = name
         self.proto = sim_debug_pb2
         self.recorder = sim_data_recorder()
         self.loaded_object = None
+        self.file_name = None
+        self.column_log = None
+        self.stream_index = None
+
+    def open(self, file_name: str):
+        """
+        prepare read() on a .simcol or .simlog recording,
+        a .pkl recording has to be converted first, see convert_to_columns
+        """
+        if not file_name.endswith((".simcol", ".simlog")):
+            raise ValueError(
+                f"{file_name} is not a .simcol or .simlog recording, "
+                "convert it with convert_to_columns or use load_file"
+            )
+        self.file_name = file_name
+        self.column_log = None
+        self.stream_index = None
+        if file_name.endswith(".simcol"):
+            self.column_log = sim_column_log(file_name)
+        elif os.path.exists(file_name + ".idx"):
+            self.stream_index = np.fromfile(file_name + ".idx", dtype=index_dtype)
+        return self
+
+    def read(self, t_start: float, t_end: float, fields=None) -> dict:
+        """
+        steps with t_start <= t <= t_end of the opened recording, frames without
+        times are skipped and a missing sub message reads as NaN
+            input:
+                fields: column names (see get_column_names), None for all
+            output:
+                {"times": array, field: array, ...}
+        """
+        if self.column_log is not None:
+            return self.column_log.read(t_start, t_end, fields)
+        names = ["times"] + [
+            name for name in fields or get_column_names() if name != "times"
+        ]
+        values = {name: array("f") for name in names}
+        offset = 0
+        if self.stream_index is not None and self.stream_index.size > 0:
+            k = np.searchsorted(self.stream_index["t"], t_start, side="right") - 1
+            offset = int(self.stream_index["offset"][max(k, 0)])
+        for frame in self.read_stream(self.file_name, offset):
+            if not frame.times:
+                continue
+            t = frame.times[0]
+            if t > t_end:
+                break
+            if t < t_start:
+                continue
+            values["times"].append(t)
+            for name in names[1:]:
+                if name in step_columns:
+                    value = getattr(frame, name)
+                    values[name].append(value[0] if value else np.nan)
+                    continue
+                message, field = name.split(".")
+                items = getattr(frame, message)
+                values[name].append(getattr(items[0], field) if items else np.nan)
+        return {
+            name: np.frombuffer(value, dtype=np.float32) for name, value in values.items()
+        }
+
+    def read_stream(self, file_name: str, offset: int = 0):
+        """
+        iterate the frames of a sim_stream_recorder file one at a time,
+        starting at byte offset, a frame cut off by a crash ends the iteration
+        """
+        with open(file_name, "rb") as f:
+            f.seek(offset)
+            while True:
+                size = read_varint(f)
+                if size is None:
+                    return
+                data = f.read(size)
+                if len(data) < size:
+                    return
+                frame = sim_debug_pb2.sim_debug()
+                frame.ParseFromString(data)
+                yield frame
+
+    def load_stream(self, file_name: str) -> sim_debug_pb2.sim_debug:
+        """
+        all frames of a stream merged into one sim_debug
+        """
+        data = sim_debug_pb2.sim_debug()
+        for frame in self.read_stream(file_name):
+            data.MergeFrom(frame)
+        return data
+
+    def load_file(self, file_name: str):
+        """
+        sim_debug for .pkl / .simlog, sim_column_log for .simcol
+        """
+        if file_name.endswith(".simcol"):
+            return sim_column_log(file_name)
+        if file_name.endswith(".simlog"):
+            return self.load_stream(file_name)
+        with open(file_name, "rb") as file:
+            return pickle.load(file)
 
     def analyze_data(self):
-        
+        import tkinter.filedialog  # interactive only, keeps headless use free of tk
+        import matplotlib.pyplot as plt
+
         file_name = tkinter.filedialog.askopenfilename(
-            title="select replay data file", filetypes=[("Pickle Files", "*.pkl")]
+            title="select replay data file",
+            filetypes=[("Replay Files", "*.simcol *.simlog *.pkl")],
         )
     
         # Handle case where user cancels the dialog
@@ -56,8 +442,7 @@ class sim_data_player:
             return
     
         try:
-            with open(file_name, "rb") as file:
-                self.loaded_object = pickle.load(file)
+            self.loaded_object = self.load_file(file_name)
         except Exception as e:
             print(f"Failed to load file: {e}")
             return
@@ -65,41 +450,126 @@ class sim_data_player:
         #####################################
         #########  Show Info History ########
         #####################################
+        self.plot_data(self.loaded_object)
+        plt.show()
+
+    def plot_data(self, data):
+        """
+        five subplot history of a loaded recording
+        """
+        import matplotlib.pyplot as plt  # plotting only, keeps headless use free of matplotlib
+
+        columns = data if isinstance(data, sim_column_log) else get_columns(data)
         fig2, axes = plt.subplots(5, 1)
         fig2.canvas.manager.set_window_title("Ego Vehicle Motion Info")
-    
-        Hist_Sts = self.loaded_object.vehicle_state_debug
-        Hist_Cmd = self.loaded_object.controller_debug
-        time = self.loaded_object.times
-    
-        kappa = [item.kappa for item in Hist_Sts]
+
+        time = columns["times"]
+
+        kappa = columns["vehicle_state_debug.kappa"]
         axes[0].plot(time, kappa, c="r", label="kappa")
-        axes[0].set_ylabel("$\kappa$")
+        axes[0].set_ylabel("$\\kappa$")
         axes[0].grid(True)
-    
-        velocity = [item.velocity for item in Hist_Sts]
+
+        velocity = columns["vehicle_state_debug.velocity"]
         axes[1].plot(time, velocity, c="b", label="velocity")
         axes[1].set_ylabel("$v$")
         axes[1].grid(True)
-    
-        acceleration_sts = [item.acceleration for item in Hist_Sts]
+
+        acceleration_sts = columns["vehicle_state_debug.acceleration"]
         axes[2].plot(time, acceleration_sts, c="g", label="acceleration")
         axes[2].set_ylabel("ax")
         axes[2].grid(True)
-    
-        kappa_rate = [item.kappa_rate for item in Hist_Cmd]
+
+        kappa_rate = columns["controller_debug.kappa_rate"]
         axes[3].plot(time, kappa_rate, c="y", label="kappa_rate")
         axes[3].set_ylabel("kappa_rate")
         axes[3].grid(True)
-    
-        acceleration_cmd = [item.acceleration for item in Hist_Cmd]
+
+        acceleration_cmd = columns["controller_debug.acceleration"]
         axes[4].plot(time, acceleration_cmd, c="b", label="acceleration")
         axes[4].set_ylabel("a")
         axes[4].grid(True)
-    
-        plt.show()
+        return fig2
 
 
 if __name__ == "__main__":
-    player = sim_data_player()
-    player.analyze_data()
+    import matplotlib.pyplot as plt
+
+    if sys.argv[1:] == ["benchmark"]:
+        ### load to first plot, 1M step log: pickle vs memory mapped columns ###
+        import tempfile
+
+        n = 1_000_000
+        rng = np.random.default_rng(0)
+        values = rng.standard_normal((9, n)).astype(np.float32)
+        data = sim_debug_pb2.sim_debug()
+        data.times.extend(np.arange(n, dtype=np.float32) * 0.2)
+        for i in range(n):
+            state = data.vehicle_state_debug.add()
+            state.x, state.y, state.theta = values[0, i], values[1, i], values[2, i]
+            state.kappa, state.velocity = values[3, i], values[4, i]
+            state.acceleration = values[5, i]
+            cmd = data.controller_debug.add()
+            cmd.kappa_rate, cmd.acceleration = values[6, i], values[7, i]
+        folder = tempfile.mkdtemp()
+        pkl_file = os.path.join(folder, "log.pkl")
+        col_file = os.path.join(folder, "log.simcol")
+        with open(pkl_file, "wb") as f:
+            pickle.dump(data, f)
+        del data
+        t0 = time.perf_counter()
+        convert_to_columns(pkl_file, col_file)
+        print(f"convert pkl -> simcol : {time.perf_counter() - t0:.2f} s")
+        player = sim_data_player()
+        for file_name in (pkl_file, col_file):
+            t0 = time.perf_counter()
+            fig = player.plot_data(player.load_file(file_name))
+            fig.canvas.draw()
+            elapsed = time.perf_counter() - t0
+            size = os.path.getsize(file_name) / 1e6
+            extension = os.path.splitext(file_name)[1]
+            print(f"{extension:>7} : {size:5.1f} MB, load to first plot {elapsed:.2f} s")
+            plt.close(fig)
+        log = sim_column_log(col_file)
+        assert np.array_equal(log["vehicle_state_debug.kappa"], values[3])
+        assert np.shares_memory(log["controller_debug.kappa_rate"], log.mm)
+    elif sys.argv[1:] == ["benchmark_read"]:
+        ### 5 s window read latency against log length ###
+        import tempfile
+
+        folder = tempfile.mkdtemp()
+        fields = ["vehicle_state_debug.kappa", "controller_debug.kappa_rate"]
+        print("steps      simcol [ms]   simlog [ms]")
+        for n in (10_000, 100_000, 1_000_000):
+            rng = np.random.default_rng(0)
+            columns = {
+                name: rng.standard_normal(n).astype(np.float32)
+                for name in get_column_names()
+            }
+            columns["times"] = np.arange(n, dtype=np.float32) * np.float32(0.2)
+            col_file = os.path.join(folder, f"log_{n}.simcol")
+            write_columns(col_file, columns)
+            stream_file = os.path.join(folder, f"log_{n}.simlog")
+            recorder = sim_stream_recorder().open(stream_file)
+            state = sim_debug_pb2.vehicle_state_debug()
+            cmd = sim_debug_pb2.controller_debug()
+            for i in range(n):
+                state.kappa = columns["vehicle_state_debug.kappa"][i]
+                cmd.kappa_rate = columns["controller_debug.kappa_rate"][i]
+                recorder.write_step(columns["times"][i], state, cmd)
+            recorder.close()
+            t_start = float(columns["times"][n // 2])
+            latency = []
+            for file_name in (col_file, stream_file):
+                player = sim_data_player().open(file_name)
+                t0 = time.perf_counter()
+                for _ in range(20):
+                    window = player.read(t_start, t_start + 5.0, fields)
+                latency.append((time.perf_counter() - t0) / 20 * 1e3)
+                i0 = n // 2
+                assert window["times"].size == 26
+                assert np.array_equal(window[fields[0]], columns[fields[0]][i0 : i0 + 26])
+            print(f"{n:>9} {latency[0]:>13.3f} {latency[1]:>13.3f}")
+    else:
+        player = sim_data_player()
+        player.analyze_data()
@@ -0,0 +1,240 @@
+import time
+import numpy as np
+import instrumentation
+import referenceline
+from instrumentation import span, span_tracer
+from vehicle_model import vehicle_model
+from referenceline import reference_line
+from controller import LongPid_Controller, LatKmMpc_Controller, ts, horizon
+from object import object, detect_sensor
+from proto import sim_debug_pb2
+
+
+class Simulation:
+    """
+    Closed loop of ego vehicle, sensor and lateral / longitudinal controllers.
+
+    The engine has no plotting dependency and runs as fast as the solver
+    allows. Anything that wants to look at the loop (a renderer, a logger)
+    is registered with add_observer and called once per step, after the
+    commands are computed and before the world moves on.
+
+    With a span_tracer every step records named spans of its stages and its
+    wall clock time goes into the step_times column of the debug record.
+    """
+
+    def __init__(
+        self,
+        ego: vehicle_model,
+        sensor: detect_sensor,
+        ref_line: reference_line,
+        lat_controller: LatKmMpc_Controller,
+        lon_controller: LongPid_Controller,
+        target_name: str = "car",
+        dt: float = ts,
+        horizon: int = horizon,
+        recorder=None,
+        tracer: span_tracer = None,
+    ):
+        self.ego = ego
+        self.sensor = sensor
+        self.ref_line = ref_line
+        self.lat_controller = lat_controller
+        self.lon_controller = lon_controller
+        self.target_name = target_name
+        self.dt = dt
+        self.horizon = horizon
+        self.observers = []
+        ## state of the current step ##
+        self.step_count = 0
+        self.time = 0.0
+        self.nearest_point = None
+        self.control_ref = None
+        self.kappa_rate = 0.0
+        self.acceleration = 0.0
+        ## debug record, same layout as draw_env ##
+        # with a sim_stream_recorder every step goes to disk instead of memory
+        self.recorder = recorder
+        self.debugger = sim_debug_pb2.sim_debug()
+        self.vehicle_state_debug = None
+        self.controller_debug = None
+        ## instrumentation, off without a tracer ##
+        self.tracer = tracer
+
+    def add_observer(self, observer):
+        """
+        observer(sim) is called every step
+        """
+        self.observers.append(observer)
+
+    def step(self):
+        """
+        one control cycle: reference, commands, record, kinematics, sensor
+            output:
+                kappa_rate, acceleration
+        """
+        if self.tracer is None:
+            self.update()
+            return self.write_record(None)
+        previous = instrumentation.activate(self.tracer)
+        try:
+            t_start = time.perf_counter_ns()
+            self.update()
+            t_end = time.perf_counter_ns()
+        finally:
+            instrumentation.activate(previous)
+        self.tracer.add("sim.step", t_start, t_end)
+        return self.write_record((t_end - t_start) * 1e-9)
+
+    def update(self):
+        ego = self.ego
+        dt = self.dt
+        #### control reference #####
+        with span("referenceline.get_nearest_point"):
+            self.nearest_point = self.ref_line.get_nearest_point(
+                ego.X, ego.Y, key=ego.name
+            )
+        with span("referenceline.get_points_from_S"):
+            ds = ego.velocity * dt * np.arange(self.horizon)
+            self.control_ref = self.ref_line.get_points_from_S(self.nearest_point, ds)
+        #### controller command #####
+        with span("LatKmMpc_Controller.Update"):
+            self.kappa_rate = self.lat_controller.Update(
+                ego.get_vehicle_status(), self.control_ref
+            )
+        with span("LongPid_Controller.Update"):
+            self.acceleration = self.lon_controller.Update(
+                ego, self.sensor.get_object_by_name(self.target_name)
+            )
+        #### record #####
+        with span("sim.record"):
+            if self.recorder is None:
+                self.debugger.times.append(self.time)
+                self.vehicle_state_debug = self.debugger.vehicle_state_debug.add()
+                self.controller_debug = self.debugger.controller_debug.add()
+            else:
+                self.vehicle_state_debug = sim_debug_pb2.vehicle_state_debug()
+                self.controller_debug = sim_debug_pb2.controller_debug()
+            ego.debug_proto(debug_proto=self.vehicle_state_debug)
+            self.lat_controller.debug_proto(debug_proto=self.controller_debug)
+            self.lon_controller.debug_proto(debug_proto=self.controller_debug)
+        with span("sim.observers"):
+            for observer in self.observers:
+                observer(self)
+        #### kinematic model and sensor update #####
+        with span("vehicle_model.kinematic_Update"):
+            ego.kinematic_Update(
+                kappa_rate=self.kappa_rate, acceleration=self.acceleration, dt=dt
+            )
+        with span("detect_sensor.Update"):
+            self.sensor.Update(dt)
+
+    def write_record(self, step_time: float):
+        """
+        finish the step: record step_time if measured, advance the clock
+        """
+        if self.recorder is not None:
+            self.recorder.write_step(
+                self.time, self.vehicle_state_debug, self.controller_debug, step_time
+            )
+        elif step_time is not None:
+            self.debugger.step_times.append(step_time)
+        self.step_count += 1
+        self.time = self.step_count * self.dt
+        return self.kappa_rate, self.acceleration
+
+    def snapshot(self) -> dict:
+        """
+        what a renderer draws for the current step, plain arrays and floats
+        that are cheap to copy into a queue for another process
+        """
+        ego = self.ego
+        return dict(
+            time=self.time,
+            ego=np.array(ego.position()),
+            targets=self.sensor.get_object_positions(),
+            nearest=np.array([self.nearest_point.x, self.nearest_point.y]),
+            control_ref=np.column_stack([self.control_ref.x, self.control_ref.y]),
+            velocity=ego.velocity,
+            acceleration=ego.acceleration,
+            kappa=ego.kappa,
+        )
+
+    def run(self, n_steps: int):
+        """
+        run n_steps control cycles, returns the debug record
+        """
+        for _ in range(n_steps):
+            self.step()
+        return self.debugger
+
+    def save(self, recorder):
+        recorder.save_data(self.debugger)
+
+
+def make_default_simulation(
+    ref_line: reference_line = None, recorder=None, tracer=None
+) -> Simulation:
+    """
+    scenario of draw_env: ego behind a car driving along ref_line,
+    straight_road by default
+    """
+    if ref_line is None:
+        ref_line = referenceline.straight_road
+    ego = vehicle_model("ego", 0.01, 0.002, 15.0, -4, 0, 40)
+    sensor = detect_sensor(ego)
+    sensor.register_object(object("car", 1.9, 5.0, 20.0, 100.0 / 3.6, ref_line, 2.0))
+    sensor.register_ref_line(ref_line)
+    return Simulation(
+        ego,
+        sensor,
+        ref_line,
+        LatKmMpc_Controller(ts, horizon, persistent=True),
+        LongPid_Controller(1.5, 30.0),
+        recorder=recorder,
+        tracer=tracer,
+    )
+
+
+if __name__ == "__main__":
+    n_steps = 200
+    sim = make_default_simulation()
+    t0 = time.perf_counter()
+    sim.run(n_steps)
+    t_headless = time.perf_counter() - t0
+    print(f"headless : {n_steps / t_headless:.1f} steps/s")
+
+    ### streaming recorder, constant memory ###
+    import os
+    import tempfile
+    import tracemalloc
+    from replay_data import sim_stream_recorder, sim_data_player
+
+    file_name = os.path.join(tempfile.gettempdir(), "simulation_demo.simlog")
+    for recorder in (None, sim_stream_recorder("demo").open(file_name)):
+        sim = make_default_simulation(recorder=recorder)
+        sim.run(50)  # warm up, workspaces and caches
+        tracemalloc.start()
+        sim.run(2000)
+        growth = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        mode = "in memory" if recorder is None else "streaming"
+        print(f"{mode:<9} : {growth / 1e3:.1f} kB growth over 2000 steps")
+    recorder.close()
+    in_memory = sim_data_player().load_file(file_name)
+    assert len(in_memory.times) == 2050
+
+    ### visual mode, draw_env renderer as observer ###
+    import matplotlib.pyplot as plt
+    from draw_env import sim_renderer
+
+    for pause in (0.1, 0.001):
+        sim = make_default_simulation()
+        fig, ax = plt.subplots()
+        sim.add_observer(sim_renderer(ax, referenceline.straight_road.points, pause, verbose=False))
+        n_visual = 20
+        t0 = time.perf_counter()
+        sim.run(n_visual)
+        t_visual = time.perf_counter() - t0
+        plt.close(fig)
+        print(f"visual (pause {pause} s) : {n_visual / t_visual:.1f} steps/s")
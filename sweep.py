@@ -0,0 +1,189 @@
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from vehicle_model import vehicle_model
+import referenceline
+from referenceline import reference_line, roads
+from controller import LongPid_Controller, LatKmMpc_Controller, ts
+from object import object, detect_sensor
+from simulation import Simulation
+
+# one closed loop episode, every key can be swept
+default_episode = {
+    "road": "straight_road",  # name in roads or (a0, a1, a2)
+    "pos_left": True,  # initial offsets, see get_vehicle_status_from_settings
+    "yaw_left": True,
+    "kappa_left": True,
+    "horizon": 10,
+    "Q": (1.0, 1.0, 10.0, 10.0),  # diagonal of Q = QN
+    "R": 1000.0,
+    "P_pos": 0.5,
+    "P_vel": 1.0,
+    "headway": 1.5,
+    "set_speed": 30.0,
+    "target_gap": 30.0,  # initial s of the target ahead of ego
+    "target_speed": 20.0,
+    "n_steps": 100,
+}
+
+
+def get_road(road) -> reference_line:
+    if isinstance(road, str):
+        if road not in roads:
+            raise KeyError(road)
+        return getattr(referenceline, road)
+    return reference_line(*road)
+
+
+def run_episode(config: dict) -> dict:
+    """
+    one closed loop episode
+        input:
+            config: default_episode with some keys overridden
+        output:
+            row of the sweep table, config and summary metrics
+    """
+    config = {**default_episode, **config}
+    ref_line = get_road(config["road"])
+    # episodes must not depend on what ran before in the same process
+    ref_line.get_projector().last_index.pop("ego", None)
+    status = ref_line.get_vehicle_status_from_settings(
+        config["pos_left"], config["yaw_left"], config["kappa_left"]
+    )
+    ego = vehicle_model(
+        "ego",
+        status.theta,
+        status.kappa,
+        status.velocity,
+        status.acceleration,
+        status.x,
+        status.y,
+    )
+    sensor = detect_sensor(ego)
+    sensor.register_object(
+        object("car", 1.9, 5.0, config["target_gap"], config["target_speed"], ref_line)
+    )
+    lat_controller = LatKmMpc_Controller(ts, config["horizon"], persistent=True)
+    lat_controller.Q = sp.diags(np.asarray(config["Q"], dtype=float), format="csc")
+    lat_controller.QN = lat_controller.Q
+    lat_controller.R = float(config["R"])
+    lon_controller = LongPid_Controller(config["headway"], config["set_speed"])
+    lon_controller.P_pos = config["P_pos"]
+    lon_controller.P_vel = config["P_vel"]
+    sim = Simulation(
+        ego, sensor, ref_line, lat_controller, lon_controller, horizon=config["horizon"]
+    )
+
+    lat_error, kappa_rate, headway_violation = [], [], 0
+
+    def collect(sim: Simulation):
+        nonlocal headway_violation
+        point = sim.nearest_point
+        lat_error.append(
+            -(sim.ego.X - point.x) * np.sin(point.angle)
+            + (sim.ego.Y - point.y) * np.cos(point.angle)
+        )
+        kappa_rate.append(sim.kappa_rate)
+        target = sim.sensor.get_object_by_name("car")
+        if target.s - sim.ego.s < config["headway"] * sim.ego.velocity:
+            headway_violation += 1
+
+    sim.add_observer(collect)
+    sim.run(config["n_steps"])
+    lat_error = np.array(lat_error)
+    row = dict(config)
+    row["road"] = str(config["road"])
+    row["Q"] = " ".join(f"{q:g}" for q in config["Q"])
+    row.update(
+        lat_error_rms=float(np.sqrt(np.mean(lat_error**2))),
+        lat_error_final=float(abs(lat_error[-1])),
+        max_kappa_rate=float(np.max(np.abs(kappa_rate))),
+        headway_violations=headway_violation,
+    )
+    return row
+
+
+def grid_configs(**axes) -> list:
+    """
+    full factorial grid, e.g. grid_configs(R=[100, 1000], road=list(roads)).
+    "run" labels each config by its index in the grid.
+    """
+    keys = list(axes)
+    return [
+        dict(zip(keys, values), run=f"grid-{i}")
+        for i, values in enumerate(itertools.product(*axes.values()))
+    ]
+
+
+def random_configs(n: int, seed: int = 0, **distributions) -> list:
+    """
+    n configs with every key drawn from its distribution,
+    distribution(rng) -> value, e.g. R=lambda rng: rng.uniform(100, 5000).
+    The same seed always gives the same configs, "run" is labeled "<seed>-<i>"
+    so runs of sweeps with different seeds or n never share a label.
+    """
+    configs = []
+    for i in range(n):
+        rng = np.random.default_rng([seed, i])
+        config = {key: draw(rng) for key, draw in distributions.items()}
+        config["run"] = f"{seed}-{i}"
+        configs.append(config)
+    return configs
+
+
+def run_sweep(configs: list, processes: int = None, chunksize: int = 4) -> list:
+    """
+    run every config in a process pool, rows in the order of configs
+    """
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        return [run_episode(config) for config in configs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(run_episode, configs, chunksize=chunksize))
+
+
+def save_table(rows: list, file_name: str):
+    with open(file_name, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    configs = grid_configs(
+        road=list(roads),
+        pos_left=[True, False],
+        yaw_left=[True, False],
+        R=[100.0, 1000.0],
+        headway=[1.0, 2.0],
+    )
+    print(f"{len(configs)} episodes, {os.cpu_count()} cpu(s)")
+    for processes in sorted({1, 2, os.cpu_count()}):
+        t0 = time.perf_counter()
+        rows = run_sweep(configs, processes)
+        elapsed = time.perf_counter() - t0
+        print(f"{processes} process(es) : {len(configs) / elapsed:.1f} episodes/s")
+        if processes == 1:
+            reference = rows
+        else:
+            assert rows == reference  # deterministic, independent of the pool
+    file_name = os.path.join(tempfile.gettempdir(), "sweep.csv")
+    save_table(rows, file_name)
+    best = min(rows, key=lambda row: row["lat_error_rms"])
+    print(f"table: {file_name}")
+    print(
+        "best lat_error_rms "
+        f"{best['lat_error_rms']:.3f} m: road {best['road']}, R {best['R']}"
+    )
+    random_rows = run_sweep(
+        random_configs(8, seed=1, R=lambda rng: rng.uniform(100.0, 5000.0)), 1
+    )
+    assert random_rows == run_sweep(
+        random_configs(8, seed=1, R=lambda rng: rng.uniform(100.0, 5000.0)), 1
+    )
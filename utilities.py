@@ -1,8 +1,5 @@
 import numpy as np
 
-import matplotlib.pyplot as plt
-import matplotlib.patheffects as path_effects
-
 field_size  = {"x_min": -10, "x_max": 200, "y_min": -10, "y_max": 100}
 
 map_radius = [50, 200, 500, 1000, 1500, 5000]
@@ -53,6 +50,8 @@ def max_heading_diff():
 
 
 def show_start_message(ax):
+    import matplotlib.patheffects as path_effects  # plotting only, keeps headless use free of matplotlib
+
     t = ax.text(
         0.5,
         0.5,
@@ -70,6 +69,8 @@ def show_start_message(ax):
 
 
 def show_end_message(ax):
+    import matplotlib.patheffects as path_effects
+
     t = ax.text(
         0.5,
         0.5,
@@ -1,8 +1,4 @@
 import numpy as np
-import scipy as sp
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from scipy import sparse
 from proto import sim_debug_pb2
 class vehicle_status:
     def __init__(
@@ -108,6 +104,8 @@ class vehicle_model:
             self.X, self.Y, self.angle, self.kappa, self.velocity, self.acceleration
         )
     def plot_vehicle(self, ax):
+        import matplotlib.patches as patches  # plotting only, keeps headless use free of matplotlib
+
         loc = self.position()
         rect = patches.Polygon(
             loc,
@@ -128,8 +126,158 @@ class vehicle_model:
         debug_proto.acceleration = self.acceleration
 
 
+def get_corner_points(X, Y, angle, Width, Length) -> np.ndarray:
+    """
+    corner points of many rectangles, vehicle_model.position vectorized
+        input:
+            X, Y, angle: rear center and heading [N]
+            Width, Length: size, scalar or [N]
+        output:
+            points [N, 4, 2]: left front, right front, right rear, left rear
+    """
+    X, Y, angle = np.asarray(X), np.asarray(Y), np.asarray(angle)
+    cos_angle = np.cos(angle)
+    sin_angle = np.sin(angle)
+    half_w_x = np.multiply(Width, 0.5) * sin_angle
+    half_w_y = np.multiply(Width, 0.5) * cos_angle
+    front_x = X + np.multiply(Length, cos_angle)
+    front_y = Y + np.multiply(Length, sin_angle)
+    points = np.empty((X.size, 4, 2))
+    points[:, 0, 0] = front_x - half_w_x
+    points[:, 0, 1] = front_y + half_w_y
+    points[:, 1, 0] = front_x + half_w_x
+    points[:, 1, 1] = front_y - half_w_y
+    points[:, 2, 0] = X + half_w_x
+    points[:, 2, 1] = Y - half_w_y
+    points[:, 3, 0] = X - half_w_x
+    points[:, 3, 1] = Y + half_w_y
+    return points
+
+
+class VehicleFleet:
+    """
+    N vehicles with the kinematics of vehicle_model, one array per state.
+    All vehicles are advanced by one vectorized call.
+    """
+
+    def __init__(self, names, angle, kappa, velocity, acceleration, X, Y):
+        self.names = list(names)
+        n = len(self.names)
+        self.angle = np.array(np.broadcast_to(angle, n), dtype=float)
+        self.kappa = np.array(np.broadcast_to(kappa, n), dtype=float)
+        self.velocity = np.array(np.broadcast_to(velocity, n), dtype=float)
+        self.acceleration = np.array(np.broadcast_to(acceleration, n), dtype=float)
+        self.X = np.array(np.broadcast_to(X, n), dtype=float)
+        self.Y = np.array(np.broadcast_to(Y, n), dtype=float)
+        self.s = np.zeros(n)
+        self.Width = np.full(n, 1.9)
+        self.Length = np.full(n, 5.0)
+
+    @classmethod
+    def from_vehicles(cls, vehicles: list):
+        fleet = cls(
+            [v.name for v in vehicles],
+            [v.angle for v in vehicles],
+            [v.kappa for v in vehicles],
+            [v.velocity for v in vehicles],
+            [v.acceleration for v in vehicles],
+            [v.X for v in vehicles],
+            [v.Y for v in vehicles],
+        )
+        fleet.s[:] = [v.s for v in vehicles]
+        fleet.Width[:] = [v.Width for v in vehicles]
+        fleet.Length[:] = [v.Length for v in vehicles]
+        return fleet
+
+    def __len__(self):
+        return len(self.names)
+
+    def kinematic_Update(self, kappa_rate=0.0, acceleration=0.0, dt: float = 0.2):
+        """
+        same model as vehicle_model.kinematic_Update for every vehicle
+             input:
+                kappa_rate: kappa rate, scalar or [N]
+                acceleration: acceleration, scalar or [N]
+                dt: sample time
+        """
+        # same operation order as vehicle_model, bit identical for every vehicle
+        self.kappa = self.kappa + np.asarray(kappa_rate) * dt
+        delta_theta = self.kappa * self.velocity * dt
+        cos_angle = np.cos(self.angle)
+        sin_angle = np.sin(self.angle)
+        self.Y = (
+            self.Y
+            + self.velocity * cos_angle * delta_theta * dt
+            + self.velocity * sin_angle * dt
+        )
+        self.X = (
+            self.X
+            - self.velocity * sin_angle * delta_theta * dt
+            + self.velocity * cos_angle * dt
+        )
+        self.angle = self.angle + delta_theta
+        self.acceleration[:] = acceleration
+        self.velocity = self.velocity + self.acceleration * dt
+        self.s = self.s + self.velocity * dt + 0.5 * self.acceleration * dt * dt
+
+    def position(self) -> np.ndarray:
+        """
+        corner points of every vehicle in global coordinate
+            output:
+                points [N, 4, 2]: left front, right front, right rear, left rear
+        """
+        return get_corner_points(self.X, self.Y, self.angle, self.Width, self.Length)
+
+    def get_vehicle_status(self, i: int) -> vehicle_status:
+        return vehicle_status(
+            self.X[i],
+            self.Y[i],
+            self.angle[i],
+            self.kappa[i],
+            self.velocity[i],
+            self.acceleration[i],
+        )
+
 
 if __name__ == "__main__":
+    import time
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+
+    ### VehicleFleet against vehicle_model ###
+    rng = np.random.default_rng(0)
+    n = 10000
+    vehicles = [
+        vehicle_model(
+            f"car_{i}",
+            rng.uniform(-np.pi, np.pi),
+            rng.uniform(-0.01, 0.01),
+            rng.uniform(0.0, 30.0),
+            0.0,
+            rng.uniform(0.0, 200.0),
+            rng.uniform(0.0, 100.0),
+        )
+        for i in range(n)
+    ]
+    fleet = VehicleFleet.from_vehicles(vehicles)
+    kappa_rate = rng.uniform(-0.05, 0.05, (20, n))
+    acceleration = rng.uniform(-2.0, 2.0, (20, n))
+    t0 = time.perf_counter()
+    for k in range(20):
+        for i, vehicle in enumerate(vehicles):
+            vehicle.kinematic_Update(kappa_rate[k, i], acceleration[k, i], 0.2)
+        corners = [vehicle.position() for vehicle in vehicles]
+    t1 = time.perf_counter()
+    for k in range(20):
+        fleet.kinematic_Update(kappa_rate[k], acceleration[k], 0.2)
+        fleet_corners = fleet.position()
+    t2 = time.perf_counter()
+    for name in ("X", "Y", "angle", "kappa", "velocity", "s"):
+        assert np.array_equal([getattr(v, name) for v in vehicles], getattr(fleet, name))
+    assert np.allclose(np.array(corners), fleet_corners, rtol=1e-12, atol=1e-12)
+    print(f"{n} vehicles, per vehicle loop : {(t1 - t0) / 20 * 1e3:.2f} ms/step")
+    print(f"{n} vehicles, VehicleFleet     : {(t2 - t1) / 20 * 1e3:.2f} ms/step")
+
     ego = vehicle_model(
         name="ego",
         angle=20.0,
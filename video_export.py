@@ -0,0 +1,277 @@
+import multiprocessing
+import os
+import pickle
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import numpy as np
+from controller import ts
+from simulation import Simulation
+
+video_formats = (".gif", ".mp4")
+
+
+class ffmpeg_encoder:
+    """
+    raw rgba frames piped into a local ffmpeg binary, constant memory
+    """
+
+    def __init__(self, file_name: str, fps: float, width: int, height: int):
+        command = [
+            shutil.which("ffmpeg"),
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgba",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            f"{fps}",
+            "-i",
+            "-",
+        ]
+        if file_name.endswith(".gif"):
+            command += ["-vf", "split[a][b];[a]palettegen[p];[b][p]paletteuse"]
+        else:
+            command += ["-vcodec", "libx264", "-pix_fmt", "yuv420p"]
+        self.proc = subprocess.Popen(command + [file_name], stdin=subprocess.PIPE)
+
+    def write(self, image: np.ndarray):
+        self.proc.stdin.write(image.tobytes())
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.proc.returncode}")
+
+
+class pillow_gif_encoder:
+    """
+    GIF through Pillow, written frame by frame with the palette of the first
+    frame, constant memory
+    """
+
+    def __init__(self, file_name: str, fps: float, width: int, height: int):
+        self.file = open(file_name, "wb")
+        self.duration = int(round(1000.0 / fps))
+        self.palette = None
+
+    def write(self, image: np.ndarray):
+        from PIL import Image, GifImagePlugin
+
+        frame = Image.fromarray(np.ascontiguousarray(image[..., :3]))
+        if self.palette is None:
+            # the scene has few colors, one global palette fits every frame
+            self.palette = frame.quantize(colors=256, method=Image.FASTOCTREE)
+            header, _ = GifImagePlugin.getheader(self.palette, info={"loop": 0})
+            self.file.write(b"".join(header))
+        frame = frame.quantize(palette=self.palette, dither=0)
+        self.file.write(b"".join(GifImagePlugin.getdata(frame, duration=self.duration)))
+
+    def close(self):
+        self.file.write(b";")  # trailer
+        self.file.close()
+
+
+def get_encoder(file_name: str, fps: float, width: int, height: int):
+    if shutil.which("ffmpeg") is not None:
+        return ffmpeg_encoder(file_name, fps, width, height)
+    if file_name.endswith(".gif"):
+        return pillow_gif_encoder(file_name, fps, width, height)
+    raise ValueError(f"{file_name}: mp4 export needs an ffmpeg binary on the PATH")
+
+
+def spool_frames(frames, file_name: str, available: threading.Semaphore):
+    """
+    move batches from the queue to a spool file as fast as they arrive,
+    so the queue never fills up while the worker is rendering
+    """
+    with open(file_name, "wb") as spool:
+        while True:
+            batch = frames.get()
+            pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
+            spool.flush()
+            available.release()
+            if batch is None:
+                return
+
+
+def export_worker(frames, file_name: str, trajectory, fps: float, figsize, dpi: int):
+    """
+    worker process: rasterize queued snapshots with Agg and encode them
+    """
+    if hasattr(os, "nice"):
+        os.nice(10)  # on a busy machine the simulation goes first
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from draw_env import sim_blit_renderer
+
+    fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+    fig.tight_layout()
+    ax.set_facecolor("lightgreen")
+    renderer = sim_blit_renderer(ax, trajectory, pause=0.0, verbose=False)
+    renderer.setup()
+    width, height = fig.canvas.get_width_height()
+    encoder = get_encoder(file_name, fps, width, height)
+    with tempfile.TemporaryDirectory() as spool_dir:
+        spool_name = os.path.join(spool_dir, "frames.spool")
+        open(spool_name, "wb").close()
+        available = threading.Semaphore(0)
+        spooler = threading.Thread(
+            target=spool_frames, args=(frames, spool_name, available), daemon=True
+        )
+        spooler.start()
+        with open(spool_name, "rb") as spool:
+            while True:
+                available.acquire()
+                batch = pickle.load(spool)
+                if batch is None:
+                    break
+                for frame in batch:
+                    renderer.render_frame(frame)
+                    encoder.write(np.asarray(fig.canvas.buffer_rgba()))
+        spooler.join()
+    encoder.close()
+    plt.close(fig)
+
+
+class sim_video_exporter:
+    """
+    Simulation observer that records a GIF / MP4 without rendering in the
+    simulation process.
+
+    Every step only a Simulation.snapshot is taken. Snapshots are sent in
+    batches through a bounded queue to a worker process, which draws them
+    with the Agg backend and encodes the frames. Rendering is much slower
+    than a headless step, so the worker first spools the batches to a
+    temporary file and renders from there: the queue stays short, the
+    simulation does not wait for the renderer and memory stays bounded for
+    a video of any length. The video is complete when close() returns.
+    """
+
+    def __init__(
+        self,
+        file_name: str,
+        trajectory,
+        fps: float = 1.0 / ts,
+        queue_size: int = 64,
+        batch_size: int = 32,
+        figsize=(6.4, 4.8),
+        dpi: int = 100,
+    ):
+        if os.path.splitext(file_name)[1] not in video_formats:
+            raise ValueError(f"{file_name}: video format must be one of {video_formats}")
+        if file_name.endswith(".mp4") and shutil.which("ffmpeg") is None:
+            raise ValueError(f"{file_name}: mp4 export needs an ffmpeg binary on the PATH")
+        self.file_name = file_name
+        self.trajectory = trajectory
+        self.fps = fps
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.figsize = figsize
+        self.dpi = dpi
+        self.frames = None
+        self.worker = None
+        self.batch = []
+        self.n_frames = 0
+
+    def start(self):
+        # spawn, the worker must not inherit an interactive backend
+        context = multiprocessing.get_context("spawn")
+        self.frames = context.Queue(maxsize=self.queue_size)
+        self.worker = context.Process(
+            target=export_worker,
+            args=(
+                self.frames,
+                self.file_name,
+                self.trajectory,
+                self.fps,
+                self.figsize,
+                self.dpi,
+            ),
+            daemon=True,
+        )
+        self.worker.start()
+        return self
+
+    def put(self, item):
+        while True:
+            try:
+                self.frames.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                if not self.worker.is_alive():
+                    raise RuntimeError(
+                        f"video export worker exited with code {self.worker.exitcode}"
+                    )
+
+    def __call__(self, sim: Simulation):
+        self.batch.append(sim.snapshot())
+        self.n_frames += 1
+        if len(self.batch) >= self.batch_size:
+            self.put(self.batch)
+            self.batch = []
+
+    def close(self):
+        """
+        send the last frames and wait until the video is written
+        """
+        if self.worker is None:
+            return
+        if self.batch:
+            self.put(self.batch)
+            self.batch = []
+        self.put(None)
+        self.worker.join()
+        exitcode = self.worker.exitcode
+        self.frames.close()
+        self.worker = None
+        if exitcode != 0:
+            raise RuntimeError(f"video export worker exited with code {exitcode}")
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+    from referenceline import straight_road
+    from simulation import make_default_simulation
+    from utilities import field_size
+
+    ### simulation throughput with and without a video export running ###
+    n_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    file_name = os.path.join(tempfile.gettempdir(), "simulation_demo.gif")
+    trajectory = straight_road.get_ref_points(field_size["x_max"])
+
+    sim = make_default_simulation()
+    t0 = time.perf_counter()
+    sim.run(n_steps)
+    t_headless = time.perf_counter() - t0
+
+    exporter = sim_video_exporter(file_name, trajectory).start()
+    sim = make_default_simulation()
+    sim.add_observer(exporter)
+    t0 = time.perf_counter()
+    sim.run(n_steps)
+    t_export = time.perf_counter() - t0
+    exporter.close()
+    t_video = time.perf_counter() - t0
+
+    print(f"{os.cpu_count()} cpu(s), {n_steps} steps")
+    print(f"headless          : {n_steps / t_headless:.1f} steps/s")
+    print(f"with video export : {n_steps / t_export:.1f} steps/s")
+    print(f"video written     : {t_video:.1f} s after start, {file_name}")
+    # the part the simulation pays itself, without the worker competing for cpu
+    sim = make_default_simulation()
+    sim.run(1)
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        sim.snapshot()
+    print(f"snapshot          : {(time.perf_counter() - t0) * 1e3:.1f} us/step")